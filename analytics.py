@@ -0,0 +1,165 @@
+import datetime
+
+import metrics
+
+# peak-hour buckets used by the admin chart
+HOUR_RANGES = ["0-4 AM", "5-8 AM", "9-12 PM", "1-4 PM", "5-8 PM", "9-12 AM"]
+HOUR_BINS = [0, 5, 9, 13, 17, 21, 24]
+
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+ROLLUP_TABLES = {"day": "revenue_daily", "week": "revenue_weekly", "month": "revenue_monthly"}
+
+
+# epoch seconds for a bound given as epoch, date/datetime, or local "YYYY-MM-DD[ HH:MM[:SS]]" text
+def to_epoch(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.strip())
+    elif not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return int(value.timestamp())
+
+
+# local calendar day of a bound, as used by the revenue rollups
+def to_day(value):
+    value = to_epoch(value)
+    return None if value is None else datetime.date.fromtimestamp(value).isoformat()
+
+
+# order times are epoch seconds; "since"/"until" bound them as since <= time < until, either may be None
+def time_filter(column, since=None, until=None):
+    since, until = to_epoch(since), to_epoch(until)
+    conditions, params = [], []
+    if since is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append(f"{column} < ?")
+        params.append(until)
+    return (" AND ".join(conditions) or "1"), params
+
+
+# the archive module once old orders have been archived, else None; hot queries then start at its cutoff
+def cold_storage():
+    import archive
+    return archive if archive.cutoff() is not None else None
+
+
+def hot_since(cold, since):
+    since = to_epoch(since)
+    return cold.cutoff() if since is None else max(since, cold.cutoff())
+
+
+# like time_filter, on the "day" column of the daily rollups
+def day_filter(since=None, until=None):
+    since, until = to_day(since), to_day(until)
+    conditions = [condition for condition, bound in (("day >= ?", since), ("day < ?", until)) if bound]
+    return (" AND ".join(conditions) or "1"), [bound for bound in (since, until) if bound]
+
+
+# (product_id, units) selects covering since <= day < until: whole months from the monthly rollup,
+# the days before the first and after the last whole month from the daily one
+def period_units(since=None, until=None):
+    since, until = to_day(since), to_day(until)
+    first = since
+    if since is not None and not since.endswith("-01"):
+        first = (datetime.date.fromisoformat(since).replace(day=28) + datetime.timedelta(days=4)).replace(day=1).isoformat()
+    last = None if until is None else until[:8] + "01"
+    if first is not None and last is not None and first >= last:
+        where, params = day_filter(since, until)
+        return [f"SELECT product_id, units FROM product_units_daily WHERE {where}"], params
+    months = [(condition, bound[:7]) for condition, bound in (("month >= ?", first), ("month < ?", last)) if bound]
+    parts = [f"SELECT product_id, units FROM product_units_monthly WHERE {' AND '.join(c for c, _ in months)}"]
+    params = [bound for _, bound in months]
+    for start, end in ((since, first), (last, until)):
+        if start is not None and end is not None and start < end:
+            parts.append("SELECT product_id, units FROM product_units_daily WHERE day >= ? AND day < ?")
+            params += [start, end]
+    return parts, params
+
+
+# [(period, revenue)] in period order
+@metrics.timed("analytics.revenue_by_period")
+def revenue_by_period(cursor, period="month", since=None, until=None):
+    if since is None and until is None:
+        return cursor.execute(f"SELECT {period}, revenue FROM {ROLLUP_TABLES[period]} ORDER BY {period}").fetchall()
+    # ranged totals come from the daily rollup, so bounds are whole days
+    where, params = day_filter(since, until)
+    return cursor.execute(f"""
+        SELECT strftime(?, day) AS period, SUM(revenue) FROM revenue_daily
+        WHERE {where} GROUP BY period ORDER BY period
+    """, (PERIOD_FORMATS[period], *params)).fetchall()
+
+
+# [(product name, units sold)] best sellers first
+@metrics.timed("analytics.top_products")
+def top_products(cursor, limit=5, since=None, until=None):
+    if since is not None or until is not None:
+        # ranged units come from the product rollups kept by checkout, so bounds are whole days
+        parts, params = period_units(since, until)
+        sales = f"""
+            SELECT product_id, SUM(units) AS units FROM ({" UNION ALL ".join(parts)})
+            GROUP BY product_id ORDER BY units DESC LIMIT ?
+        """
+    else:
+        # all-time units are kept per product by checkout, archived orders included
+        params = []
+        sales = "SELECT product_id, units FROM product_units ORDER BY units DESC LIMIT ?"
+    cursor.execute(f"""
+        SELECT p.name, s.units FROM ({sales}) s
+        JOIN products p ON p.id = s.product_id
+        ORDER BY s.units DESC
+    """, (*params, limit))
+    return cursor.fetchall()
+
+
+# (orders, units, revenue) for one product
+@metrics.timed("analytics.product_sales")
+def product_sales(cursor, product_id):
+    cursor.execute("""
+        SELECT COUNT(DISTINCT order_id), COALESCE(SUM(quantity), 0), COALESCE(SUM(quantity * unit_price), 0)
+        FROM order_items WHERE product_id = ?
+    """, (product_id,))
+    sales = cursor.fetchone()
+    cold = cold_storage()
+    if cold:
+        sales = tuple(hot + archived for hot, archived in zip(sales, cold.product_sales(product_id)))
+    return sales
+
+
+# [(product name, stock)] furthest below reorder level first
+@metrics.timed("analytics.low_stock")
+def low_stock(cursor, limit=5):
+    return [(row[1], row[3]) for row in low_stock_alerts(cursor, limit)]
+
+
+# [(id, name, category, stock, reorder level, deficit)] from the trigger-maintained low_stock table
+@metrics.timed("analytics.low_stock_alerts")
+def low_stock_alerts(cursor, limit=-1):
+    return cursor.execute("""
+        SELECT p.id, p.name, p.category, p.stock, p.reorder_level, l.deficit
+        FROM low_stock l JOIN products p ON p.id = l.product_id
+        ORDER BY l.deficit DESC, l.product_id LIMIT ?
+    """, (limit,)).fetchall()
+
+
+# orders per hour of day as a length-24 array
+@metrics.timed("analytics.orders_by_hour")
+def orders_by_hour(cursor, since=None, until=None):
+    import numpy as np
+    # counts come from the day/hour rollup kept by checkout, so bounds are whole days
+    where, params = day_filter(since, until)
+    cursor.execute(f"SELECT hour, SUM(orders) FROM order_hours WHERE {where} GROUP BY hour", params)
+    counts = np.zeros(24, dtype=np.int64)
+    for hour, count in cursor:
+        if hour is not None:
+            counts[hour] = count
+    return counts
+
+
+# order counts per HOUR_RANGES bucket
+@metrics.timed("analytics.peak_hours")
+def peak_hours(cursor, since=None, until=None):
+    import numpy as np
+    return np.add.reduceat(orders_by_hour(cursor, since, until), HOUR_BINS[:-1])
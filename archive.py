@@ -0,0 +1,283 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import db
+
+# cold storage settings (override with environment variables)
+# orders older than this many days move to the archive, a whole month at a time
+HORIZON_DAYS = int(os.environ.get("SHOP_ARCHIVE_DAYS", "365"))
+
+# one .npy file per column; narrow types keep the files small and every column can be memory-mapped.
+# discount_per is a float because pricing tiers may be fractional percentages.
+# times are stored as seconds since the start of the partition's month
+ORDER_COLUMNS = {"id": np.int64, "user_id": np.int64, "total_price": np.float64, "discount_per": np.float32, "time": np.uint32}
+ITEM_COLUMNS = {"order_id": np.int64, "product_id": np.int32, "quantity": np.int32, "unit_price": np.float64, "time": np.uint32}
+MANIFEST = "manifest.json"
+# local time is looked up once per quarter hour slot, which covers every real UTC offset
+SLOT = 900
+
+
+# archive directory of one database: "shop.archive" beside "shop.db", so databases that merely share
+# a file name never share partitions
+def root(source=None):
+    return f"{os.path.splitext(os.path.abspath(source or db.get_pool().path))[0]}.archive"
+
+
+# {"cutoff": epoch, "partitions": {"YYYY-MM": {...}}}; everything before the cutoff lives in the archive
+def manifest(source=None):
+    path = os.path.join(root(source), MANIFEST)
+    if not os.path.exists(path):
+        return {"cutoff": None, "partitions": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(data, source=None):
+    path = os.path.join(root(source), MANIFEST)
+    with open(f"{path}.partial", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.partial", path)
+
+
+def cutoff(source=None):
+    return manifest(source)["cutoff"]
+
+
+def month_start(epoch):
+    day = datetime.date.fromtimestamp(epoch).replace(day=1)
+    return int(datetime.datetime.combine(day, datetime.time()).timestamp())
+
+
+def next_month(start):
+    day = datetime.date.fromtimestamp(start)
+    day = day.replace(year=day.year + 1, month=1) if day.month == 12 else day.replace(month=day.month + 1)
+    return int(datetime.datetime.combine(day, datetime.time()).timestamp())
+
+
+# [(month, partition info)] whose orders fall in since <= time < until, oldest first
+def partitions(since=None, until=None, source=None):
+    return [(month, info) for month, info in sorted(manifest(source)["partitions"].items())
+            if (since is None or info["last"] >= since) and (until is None or info["first"] < until)]
+
+
+# {column: memory-mapped array} for "orders" or "items" of one partition; times stay month-relative
+def load(month, table, source=None):
+    columns = ORDER_COLUMNS if table == "orders" else ITEM_COLUMNS
+    path = os.path.join(root(source), month)
+    return {name: np.load(os.path.join(path, f"{table}.{name}.npy"), mmap_mode="r") for name in columns}
+
+
+# boolean mask of the rows in since <= time < until, or None when the whole partition is in range
+def in_range(info, times, since=None, until=None):
+    if (since is None or info["first"] >= since) and (until is None or info["last"] < until):
+        return None
+    mask = np.ones(len(times), dtype=bool)
+    if since is not None:
+        mask &= times >= max(since - info["start"], 0)
+    if until is not None:
+        mask &= times < max(until - info["start"], 0)
+    return mask
+
+
+# apply fn(datetime) to each row's local time, via one lookup per distinct quarter hour
+def by_local_time(epochs, fn):
+    slots, inverse = np.unique(np.asarray(epochs, dtype=np.int64) // SLOT, return_inverse=True)
+    values = [fn(datetime.datetime.fromtimestamp(int(slot) * SLOT)) for slot in slots]
+    return np.asarray(values)[inverse]
+
+
+# (product ids, units sold) over the archived orders in range
+def product_units(since=None, until=None, source=None):
+    units = np.zeros(0, dtype=np.int64)
+    for month, info in partitions(since, until, source):
+        items = load(month, "items", source)
+        mask = in_range(info, items["time"], since, until)
+        products, quantities = (items["product_id"], items["quantity"]) if mask is None else \
+            (items["product_id"][mask], items["quantity"][mask])
+        month_units = np.bincount(products, weights=quantities).astype(np.int64)
+        if len(month_units) > len(units):
+            month_units[:len(units)] += units
+            units = month_units
+        else:
+            units[:len(month_units)] += month_units
+    ids = np.flatnonzero(units)
+    return ids, units[ids]
+
+
+# [(period, product id, units)] over the archived orders, periods in SQLite strftime format
+def period_product_units(period_format, source=None):
+    rows = []
+    for month, info in partitions(source=source):
+        items = load(month, "items", source)
+        if not len(items["time"]):
+            continue
+        periods = by_local_time(info["start"] + items["time"].astype(np.int64), lambda t: t.strftime(period_format))
+        labels, period_index = np.unique(periods, return_inverse=True)
+        pairs, inverse = np.unique(np.stack([period_index, items["product_id"]]), axis=1, return_inverse=True)
+        units = np.bincount(inverse.ravel(), weights=items["quantity"]).astype(np.int64)
+        rows += zip(labels[pairs[0]].tolist(), pairs[1].tolist(), units.tolist())
+    return rows
+
+
+# (orders, units, revenue) for one product across the archive
+def product_sales(product_id, source=None):
+    orders = units = 0
+    revenue = 0.0
+    for month, _ in partitions(source=source):
+        items = load(month, "items", source)
+        mask = items["product_id"] == product_id
+        if mask.any():
+            quantities = items["quantity"][mask]
+            orders += len(np.unique(items["order_id"][mask]))
+            units += int(quantities.sum())
+            revenue += float((quantities * items["unit_price"][mask]).sum())
+    return orders, units, revenue
+
+
+# {period: (revenue, orders)} of the archived orders, periods in SQLite strftime format
+def revenue(period_format, source=None):
+    totals = {}
+    for month, info in partitions(source=source):
+        orders = load(month, "orders", source)
+        if not len(orders["time"]):
+            continue
+        periods = by_local_time(info["start"] + orders["time"].astype(np.int64), lambda t: t.strftime(period_format))
+        labels, inverse = np.unique(periods, return_inverse=True)
+        sums = np.bincount(inverse, weights=orders["total_price"])
+        counts = np.bincount(inverse)
+        for label, total, count in zip(labels.tolist(), sums.tolist(), counts.tolist()):
+            previous = totals.get(label, (0.0, 0))
+            totals[label] = (previous[0] + total, previous[1] + count)
+    return totals
+
+
+# write one month's rows as a partition, merged with what an earlier (interrupted) run archived
+def write_partition(month, start, orders, items, source=None):
+    path = os.path.join(root(source), month)
+    labels = [row[2] or "" for row in orders]
+    order_columns = {name: np.array([row[i] for row in orders], dtype=np.int64 if name == "time" else dtype)
+                     for name, i, dtype in zip(ORDER_COLUMNS, (0, 1, 3, 4, 5), ORDER_COLUMNS.values())}
+    item_columns = {name: np.array([row[i] for row in items], dtype=np.int64 if name == "time" else dtype)
+                    for i, (name, dtype) in enumerate(ITEM_COLUMNS.items())}
+    order_columns["time"] -= start
+    item_columns["time"] -= start
+    if os.path.exists(path):
+        old_orders, old_items = load(month, "orders", source), load(month, "items", source)
+        with np.load(os.path.join(path, "orders.products.npz")) as f:
+            old_labels = f["products"].tolist()
+        # orders already archived are kept once
+        fresh = ~np.isin(order_columns["id"], old_orders["id"])
+        labels = old_labels + [label for label, keep in zip(labels, fresh) if keep]
+        order_columns = {name: np.concatenate([old_orders[name], order_columns[name][fresh]]) for name in ORDER_COLUMNS}
+        fresh = ~np.isin(item_columns["order_id"], old_orders["id"])
+        item_columns = {name: np.concatenate([old_items[name], item_columns[name][fresh]]) for name in ITEM_COLUMNS}
+
+    partial = f"{path}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    for name, dtype in ORDER_COLUMNS.items():
+        np.save(os.path.join(partial, f"orders.{name}.npy"), order_columns[name].astype(dtype))
+    for name, dtype in ITEM_COLUMNS.items():
+        np.save(os.path.join(partial, f"items.{name}.npy"), item_columns[name].astype(dtype))
+    # the "Pen (x2)" order labels are only needed for display, so they are compressed instead of mapped
+    np.savez_compressed(os.path.join(partial, "orders.products.npz"), products=np.array(labels, dtype=str))
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(partial, path)
+
+    times = order_columns["time"].astype(np.int64) + start
+    return {
+        "start": start,
+        "end": next_month(start),
+        "orders": len(times),
+        "items": len(item_columns["order_id"]),
+        "first": int(times.min()) if len(times) else start,
+        "last": int(times.max()) if len(times) else start,
+        "revenue": round(float(order_columns["total_price"].sum()), 2),
+    }
+
+
+# move whole months of orders older than the horizon out of SQLite; returns {month: partition info}
+def archive_orders(days=HORIZON_DAYS, source=None):
+    source = source or db.get_pool().path
+    horizon = month_start(int(time.time()) - days * 86400)
+    data = manifest(source)
+    os.makedirs(root(source), exist_ok=True)
+    archived = {}
+    while True:
+        with db.connection() as conn:
+            first = conn.execute("SELECT MIN(time) FROM orders WHERE time < ?", (horizon,)).fetchone()[0]
+            if first is None:
+                break
+            start = month_start(first)
+            end = min(next_month(start), horizon)
+            # one read transaction, so the orders and their items are the same snapshot
+            conn.execute("BEGIN")
+            try:
+                orders = conn.execute("""
+                    SELECT id, user_id, products, total_price, discount_per, time FROM orders
+                    WHERE time >= ? AND time < ? ORDER BY time
+                """, (start, end)).fetchall()
+                items = conn.execute("""
+                    SELECT oi.order_id, oi.product_id, oi.quantity, oi.unit_price, o.time
+                    FROM orders o CROSS JOIN order_items oi ON oi.order_id = o.id
+                    WHERE o.time >= ? AND o.time < ?
+                """, (start, end)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        month = datetime.date.fromtimestamp(start).strftime("%Y-%m")
+        archived[month] = data["partitions"][month] = write_partition(month, start, orders, items, source)
+        # the manifest moves the cutoff before the rows go, so a crash in between never counts an order twice
+        data["cutoff"] = max(data["cutoff"] or 0, end)
+        save_manifest(data, source)
+        with db.transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE time >= ? AND time < ?)", (start, end))
+            conn.execute("DELETE FROM orders WHERE time >= ? AND time < ?", (start, end))
+    return archived
+
+
+# finish an interrupted run: drop hot rows the archive already holds (others are archived by the next run)
+def drop_archived(source=None):
+    dropped = []
+    with db.transaction(immediate=True) as conn:
+        for month, info in partitions(source=source):
+            hot = [row[0] for row in conn.execute("SELECT id FROM orders WHERE time >= ? AND time < ?", (info["start"], info["end"]))]
+            if hot:
+                dropped += [(id,) for id in np.intersect1d(hot, load(month, "orders", source)["id"]).tolist()]
+        conn.executemany("DELETE FROM order_items WHERE order_id = ?", dropped)
+        conn.executemany("DELETE FROM orders WHERE id = ?", dropped)
+    return len(dropped)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old orders to monthly columnar archive files")
+    parser.add_argument("--db", help="database file (defaults to the shop database)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="archive whole months older than the horizon")
+    run.add_argument("--days", type=int, default=HORIZON_DAYS, help="horizon in days")
+    commands.add_parser("list", help="list archived partitions")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db.configure(args.db)
+    if args.command == "run":
+        began = time.perf_counter()
+        dropped = drop_archived()
+        archived = archive_orders(args.days)
+        print({"months": len(archived), "orders": sum(info["orders"] for info in archived.values()), "dropped": dropped,
+               "cutoff": cutoff(), "seconds": round(time.perf_counter() - began, 2)})
+    elif args.command == "list":
+        for month, info in partitions():
+            print(f"{month}  {info['orders']} orders  {info['items']} items  revenue {info['revenue']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import collections
+import hashlib
+import os
+import secrets
+import threading
+import time
+
+import db
+import metrics
+
+# seconds a successful lookup (and a network session) stays valid
+SESSION_TTL = int(os.environ.get("SHOP_SESSION_TTL", "1800"))
+# most cached logins kept; the oldest are dropped first
+LOGIN_CACHE_SIZE = int(os.environ.get("SHOP_LOGIN_CACHE_SIZE", "100000"))
+
+# email -> (user id, role, password digest, expires at), oldest first
+_logins = collections.OrderedDict()
+# session token -> (user id, role, expires at), for network clients, least recently used first
+_sessions = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def _digest(password):
+    return hashlib.sha256(password.encode()).digest()
+
+
+# drop entries from the front of an oldest-first table while they are expired or over the cap;
+# expires is the tuple position of the expiry time
+def _prune(table, expires, now, cap=None):
+    while table:
+        oldest = next(iter(table.values()))
+        if oldest[expires] > now and (cap is None or len(table) <= cap):
+            return
+        table.popitem(last=False)
+
+
+def email_taken(cursor, email):
+    return cursor.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+
+# user id for matching credentials, or None
+@metrics.timed("login")
+def login(email, password, role):
+    now = time.time()
+    with _lock:
+        cached = _logins.get(email)
+    if cached and cached[3] > now:
+        user_id, user_role, digest = cached[:3]
+    else:
+        with db.connection() as conn:
+            user = conn.execute("SELECT id, role, password FROM users WHERE email = ?", (email,)).fetchone()
+        if not user:
+            return None
+        user_id, user_role, digest = user[0], user[1], _digest(user[2] or "")
+        with _lock:
+            _logins.pop(email, None)
+            _logins[email] = (user_id, user_role, digest, now + SESSION_TTL)
+            _prune(_logins, 3, now, LOGIN_CACHE_SIZE)
+    if user_role != role or not secrets.compare_digest(digest, _digest(password)):
+        return None
+    return user_id
+
+
+# new user id, or None when the email is already registered
+@metrics.timed("signup")
+def signup(name, email, password, role):
+    with db.connection() as conn:
+        return add_user(conn.cursor(), name, email, password, role)
+
+
+def add_user(cursor, name, email, password, role):
+    cursor.execute("""
+        INSERT INTO users (name, email, password, role) VALUES (?, ?, ?, ?)
+        ON CONFLICT(email) DO NOTHING
+    """, (name, email, password, role))
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def start_session(user_id, role):
+    token = secrets.token_urlsafe(24)
+    now = time.time()
+    with _lock:
+        _sessions[token] = (user_id, role, now + SESSION_TTL)
+        # abandoned sessions are never looked up again, so expired ones are dropped here
+        _prune(_sessions, 2, now)
+    return token
+
+
+# (user id, role) for a live session token, or None; each use extends the session
+def session(token):
+    now = time.time()
+    with _lock:
+        found = _sessions.get(token)
+        if not found or found[2] <= now:
+            _sessions.pop(token, None)
+            return None
+        _sessions[token] = (found[0], found[1], now + SESSION_TTL)
+        # keep the table in expiry order for _prune
+        _sessions.move_to_end(token)
+    return found[:2]
+
+
+def end_session(token):
+    with _lock:
+        _sessions.pop(token, None)
+
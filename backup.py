@@ -0,0 +1,136 @@
+import argparse
+import contextlib
+import datetime
+import glob
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import db
+
+# backup settings (override with environment variables)
+BACKUP_DIR = os.environ.get("SHOP_BACKUP_DIR", "backups")
+# pages copied per step, and the pause between steps that lets writers in
+STEP_PAGES = int(os.environ.get("SHOP_BACKUP_PAGES", "1024"))
+STEP_SLEEP = float(os.environ.get("SHOP_BACKUP_SLEEP", "0.005"))
+# snapshots kept per database by rotate()
+KEEP = int(os.environ.get("SHOP_BACKUP_KEEP", "7"))
+
+STAMP = "%Y%m%d-%H%M%S"
+
+
+def snapshot_pattern(source, directory):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(directory, f"{stem}-*.db")
+
+
+# the glob also matches "shop-eu-....db" for "shop"; keep only names with exactly the STAMP after the stem
+def is_snapshot(path, source):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return re.fullmatch(rf"{re.escape(stem)}-\d{{8}}-\d{{6}}\.db", os.path.basename(path)) is not None
+
+
+# "ok", or the problems PRAGMA integrity_check found
+def verify(path):
+    with contextlib.closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    return "ok" if rows == [("ok",)] else "; ".join(row[0] for row in rows)
+
+
+# copy the live database to a point-in-time snapshot file, a few pages at a time
+def backup(source=None, directory=BACKUP_DIR, pages=STEP_PAGES, sleep=STEP_SLEEP, check=True):
+    source = source or db.get_pool().path
+    os.makedirs(directory, exist_ok=True)
+    conn = db.connect(source)
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        time.sleep(sleep)
+
+    began = time.perf_counter()
+    try:
+        # an open read transaction pins one WAL snapshot: the copy is consistent as of this moment,
+        # and writes committed meanwhile do not restart the backup
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        taken = datetime.datetime.now()
+        path = os.path.join(directory, f"{os.path.splitext(os.path.basename(source))[0]}-{taken:{STAMP}}.db")
+        partial = f"{path}.partial"
+        with contextlib.closing(sqlite3.connect(partial)) as target:
+            conn.backup(target, pages=pages, progress=progress)
+            # the copy inherits WAL mode; a snapshot should be one self-contained file
+            target.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    copied = time.perf_counter() - began
+
+    status = verify(partial) if check else "skipped"
+    if status not in ("ok", "skipped"):
+        os.remove(partial)
+        raise sqlite3.DatabaseError(f"backup of {source} failed verification: {status}")
+    os.replace(partial, path)
+    size = os.path.getsize(path)
+    return {
+        "path": path,
+        "taken_at": taken.strftime("%Y-%m-%d %H:%M:%S"),
+        "bytes": size,
+        "steps": steps,
+        "copy_seconds": round(copied, 2),
+        "verify_seconds": round(time.perf_counter() - began - copied, 2),
+        "mb_per_sec": round(size / 1e6 / copied, 1) if copied else None,
+        "integrity": status,
+    }
+
+
+# snapshots of one database, oldest first (the timestamp in the name sorts chronologically)
+def snapshots(source=None, directory=BACKUP_DIR):
+    source = source or db.get_pool().path
+    return sorted(path for path in glob.glob(snapshot_pattern(source, directory)) if is_snapshot(path, source))
+
+
+# delete all but the newest `keep` snapshots; returns the deleted paths
+def rotate(source=None, directory=BACKUP_DIR, keep=KEEP):
+    existing = snapshots(source, directory)
+    expired = existing[:-keep] if keep > 0 else existing
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backups of the shop database")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="snapshot directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="take a snapshot while the shop keeps running")
+    create.add_argument("--pages", type=int, default=STEP_PAGES, help="pages copied per step")
+    create.add_argument("--sleep", type=float, default=STEP_SLEEP, help="seconds between steps")
+    create.add_argument("--keep", type=int, default=KEEP, help="snapshots to keep afterwards (0 keeps all)")
+    create.add_argument("--no-verify", action="store_true")
+    commands.add_parser("list", help="list snapshots, oldest first")
+    check = commands.add_parser("verify", help="run PRAGMA integrity_check on a snapshot")
+    check.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        result = backup(directory=args.dir, pages=args.pages, sleep=args.sleep, check=not args.no_verify)
+        if args.keep:
+            result["rotated"] = rotate(directory=args.dir, keep=args.keep)
+        print(result)
+    elif args.command == "list":
+        for path in snapshots(directory=args.dir):
+            print(f"{path}  {os.path.getsize(path)} bytes")
+    elif args.command == "verify":
+        status = verify(args.path)
+        print(f"{args.path}: {status}")
+        return 0 if status == "ok" else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
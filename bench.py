@@ -0,0 +1,454 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+# charts are drawn off screen while timing
+os.environ.setdefault("SHOP_HEADLESS", "1")
+
+import auth
+import backup
+import datagen
+import db
+import pricing
+import project
+import server
+
+
+# fresh database with the current schema
+def scratch_db(directory, name="bench.db", pool_size=None):
+    path = os.path.join(directory, name)
+    db.configure(path, pool_size)
+    project.create_tables()
+    return path
+
+
+# many shoppers race to check out the last units of one product
+def stress_checkout(threads=32, shoppers=1000, stock=100, quantity=1):
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_db(directory, pool_size=threads)
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO products (name, category, price, stock) VALUES ('Last Unit', 'Bench', 100, ?)", (stock,))
+            product_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.executemany("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                             [(user_id, product_id, quantity) for user_id in range(1, shoppers + 1)])
+
+        start = threading.Barrier(threads)
+        errors = []
+
+        def shop(user_ids):
+            start.wait()
+            for user_id in user_ids:
+                try:
+                    with db.connection() as conn:
+                        project.place_order(conn, user_id)
+                except Exception as e:
+                    errors.append(e)
+
+        workers = [threading.Thread(target=shop, args=(range(1 + i, shoppers + 1, threads),)) for i in range(threads)]
+        began = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        elapsed = time.perf_counter() - began
+
+        with db.connection() as conn:
+            final_stock = conn.execute("SELECT stock FROM products WHERE id=?", (product_id,)).fetchone()[0]
+            orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            sold = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items").fetchone()[0]
+        db.get_pool().close()
+
+    return {
+        "threads": threads,
+        "shoppers": shoppers,
+        "initial_stock": stock,
+        "final_stock": final_stock,
+        "orders": orders,
+        "units_sold": sold,
+        "oversold": max(sold - stock, 0) + max(-final_stock, 0),
+        "errors": len(errors),
+        "checkouts_per_sec": round(shoppers / elapsed, 1),
+    }
+
+
+# signup and login against a large users table, next to the old load-every-email check
+def signup_throughput(users=1000000, signups=10000, legacy_signups=10):
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_db(directory)
+        with db.transaction() as conn:
+            for start in range(0, users, 50000):
+                conn.executemany("INSERT INTO users (name, email, password, role) VALUES (?, ?, ?, 'user')",
+                                 ((f"User {i}", f"user{i}@example.com", f"pass{i}") for i in range(start, min(start + 50000, users))))
+
+        began = time.perf_counter()
+        for i in range(signups):
+            email = f"new{i}@example.com"
+            with db.connection() as conn:
+                taken = auth.email_taken(conn.cursor(), email)
+            if taken or not auth.signup(f"New {i}", email, "secret", "user"):
+                raise AssertionError(f"signup failed for {email}")
+        signup_seconds = time.perf_counter() - began
+
+        began = time.perf_counter()
+        for i in range(signups):
+            auth.login(f"user{i % users}@example.com", f"pass{i % users}", "user")
+        login_seconds = time.perf_counter() - began
+
+        began = time.perf_counter()
+        for i in range(legacy_signups):
+            with db.connection() as conn:
+                existing_emails = [row[0] for row in conn.execute("SELECT email FROM users")]
+            assert f"legacy{i}@example.com" not in existing_emails
+        legacy_seconds = time.perf_counter() - began
+        db.get_pool().close()
+
+    return {
+        "users": users,
+        "signups_per_sec": round(signups / signup_seconds, 1),
+        "logins_per_sec": round(signups / login_seconds, 1),
+        "legacy_signups_per_sec": round(legacy_signups / legacy_seconds, 2),
+    }
+
+
+# many network clients add to cart and check out through one server and its group-commit writer
+def server_load(clients=64, rounds=20, products=50):
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_db(directory)
+        with db.transaction() as conn:
+            conn.executemany("INSERT INTO users (name, email, password, role) VALUES (?, ?, 'pass', 'user')",
+                             [(f"Client {n}", f"client{n}@example.com") for n in range(clients)])
+            conn.executemany("INSERT INTO products (name, category, price, stock) VALUES (?, 'Bench', 100, 1000000)",
+                             [(f"Item {n}",) for n in range(products)])
+            product_ids = [row[0] for row in conn.execute("SELECT id FROM products ORDER BY id")]
+        shop = server.Server()
+        failures = []
+
+        async def client(address, n):
+            reader, writer = await asyncio.open_connection(*address)
+
+            async def call(**request):
+                writer.write(json.dumps(request).encode() + b"\n")
+                await writer.drain()
+                response = json.loads(await reader.readline())
+                if not response["ok"]:
+                    failures.append(response["error"])
+                return response
+
+            token = (await call(op="login", email=f"client{n}@example.com", password="pass"))["result"]["token"]
+            for i in range(rounds):
+                await call(op="add-to-cart", token=token, product=product_ids[(n + i) % products])
+                await call(op="checkout", token=token)
+            writer.close()
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            ready = loop.create_future()
+            serving = asyncio.create_task(shop.serve("127.0.0.1", 0, ready=ready.set_result))
+            address = await ready
+            began = time.perf_counter()
+            await asyncio.gather(*(client(address, n) for n in range(clients)))
+            elapsed = time.perf_counter() - began
+            serving.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await serving
+            return elapsed
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = asyncio.run(run())
+        with db.connection() as conn:
+            orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        db.get_pool().close()
+
+    return {
+        "clients": clients,
+        "orders": orders,
+        "failures": len(failures),
+        "checkouts_per_sec": round(orders / elapsed, 1),
+        "writes_per_sec": round(shop.batched_writes / elapsed, 1),
+        "commits": shop.batches,
+        "mean_batch": round(shop.batched_writes / shop.batches, 2) if shop.batches else 0,
+    }
+
+
+# checkout latency with and without an online backup running; about 3.6M orders make a 1 GB database
+def backup_impact(orders=200000, threads=2, baseline_seconds=3.0, pages=backup.STEP_PAGES, sleep=backup.STEP_SLEEP):
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_db(directory, pool_size=threads + 1)
+        datagen.generate(orders)
+        with db.transaction() as conn:
+            # plenty of stock, so every timed checkout succeeds
+            conn.execute("UPDATE products SET stock = 1000000000")
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+            product_ids = [row[0] for row in conn.execute("SELECT id FROM products")]
+        with db.connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(db.get_pool().path)
+
+        phase = {"name": "baseline"}
+        samples = {"baseline": [], "during_backup": []}
+        stop = threading.Event()
+
+        def shop():
+            while not stop.is_set():
+                userid = rng.choice(user_ids)
+                began = time.perf_counter()
+                with db.connection() as conn:
+                    project.add_cart_item(conn, userid, rng.choice(product_ids), 1)
+                    project.place_order(conn, userid)
+                samples[phase["name"]].append(time.perf_counter() - began)
+
+        workers = [threading.Thread(target=shop) for _ in range(threads)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for worker in workers:
+                worker.start()
+            time.sleep(baseline_seconds)
+            phase["name"] = "during_backup"
+            result = backup.backup(directory=os.path.join(directory, "backups"), pages=pages, sleep=sleep, check=False)
+            stop.set()
+            for worker in workers:
+                worker.join()
+        began = time.perf_counter()
+        result["integrity"] = backup.verify(result["path"])
+        result["verify_seconds"] = round(time.perf_counter() - began, 2)
+        db.get_pool().close()
+
+    return {
+        "orders": orders,
+        "db_bytes": size,
+        "backup": result,
+        "checkout_baseline": summarize(samples["baseline"]),
+        "checkout_during_backup": summarize(samples["during_backup"]),
+    }
+
+
+# what project.py used to import before its first prompt
+EAGER_IMPORTS = "import matplotlib.pyplot, numpy, tabulate"
+
+
+# total import time in ms of a snippet, summed over its top-level imports in -X importtime output
+def import_ms(code, env):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True)
+    total = 0
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[0].startswith("import time:") and not fields[2].startswith("  "):
+            if fields[1].strip().isdigit():
+                total += int(fields[1])
+    return round(total / 1000, 1)
+
+
+def wall_ms(code, env, runs):
+    samples = []
+    for _ in range(runs):
+        began = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - began)
+    return round(min(samples) * 1000, 1)
+
+
+# batch pricing throughput on random carts, checked against Decimal arithmetic on a sample
+def pricing_throughput(carts=1000000, runs=5, seed=42):
+    rng = np.random.default_rng(seed)
+    lengths = 1 + np.minimum(rng.poisson(1.5, carts), 9)
+    lines = int(lengths.sum())
+    prices = np.round(np.exp(rng.normal(5.5, 1.2, lines)), 2).clip(1, 200000)
+    quantities = 1 + rng.poisson(0.5, lines)
+    price_list = pricing.default()
+    samples = []
+    for _ in range(runs):
+        began = time.perf_counter()
+        priced = price_list.price(prices, quantities, lengths)
+        samples.append(time.perf_counter() - began)
+
+    mismatches, at = 0, 0
+    for n in range(min(carts, 10000)):
+        subtotal = sum(Decimal(str(p)) * int(q) for p, q in zip(prices[at:at + lengths[n]], quantities[at:at + lengths[n]]))
+        at += lengths[n]
+        percent = max(percent for minimum, percent in price_list.tiers if minimum <= subtotal)
+        discount = (subtotal * percent / 100).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        mismatches += pricing.to_rupees(priced.total[n]) != subtotal - discount
+    best = min(samples)
+    return {
+        "carts": carts,
+        "lines": lines,
+        "best_ms": round(best * 1000, 1),
+        "carts_per_sec": round(carts / best),
+        "checked": min(carts, 10000),
+        "mismatches": mismatches,
+    }
+
+
+# cold-start cost of a short command-mode run, against the old eager-import startup
+def startup_time(runs=5):
+    with tempfile.TemporaryDirectory() as directory:
+        path = scratch_db(directory)
+        db.get_pool().close()
+        env = dict(os.environ, SHOP_DB=path, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        command = "import sys, project; sys.exit(project.main(['cache-stats']))"
+        return {
+            "import_project_ms": import_ms("import project", env),
+            "import_project_eager_ms": import_ms(f"{EAGER_IMPORTS}; import project", env),
+            "command_ms": wall_ms(command, env, runs),
+            "command_eager_ms": wall_ms(f"{EAGER_IMPORTS}; {command}", env, runs),
+            "interpreter_ms": wall_ms("pass", env, runs),
+        }
+
+
+# latency summary in milliseconds for one operation
+def summarize(samples):
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "runs": n,
+        "mean_ms": round(sum(samples) / n * 1000, 3),
+        "p50_ms": round(samples[n // 2] * 1000, 3),
+        "p95_ms": round(samples[min(n - 1, int(n * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "ops_per_sec": round(n / sum(samples), 1) if sum(samples) else None,
+    }
+
+
+def timed(operation, args_list):
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in args_list:
+            began = time.perf_counter()
+            operation(*args)
+            samples.append(time.perf_counter() - began)
+    return summarize(samples)
+
+
+# time the core shop operations against a generated database, or a copy of an existing one
+def run_suite(orders=10000, source=None, runs=200, chart_runs=5, seed=42):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "suite.db")
+        if source:
+            with contextlib.closing(sqlite3.connect(f"file:{source}?mode=ro", uri=True)) as src, contextlib.closing(sqlite3.connect(path)) as dest:
+                src.backup(dest)
+            db.configure(path)
+            project.create_tables()
+            dataset = None
+        else:
+            scratch_db(directory, "suite.db")
+            dataset = datagen.generate(orders, seed=seed)
+        with db.connection() as conn:
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'user'")]
+            product_ids = [row[0] for row in conn.execute("SELECT id FROM products WHERE stock > 0")]
+            order_count = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        shoppers = rng.sample(user_ids, min(runs, len(user_ids)))
+
+        def add_to_cart(userid, product_id):
+            with db.connection() as conn:
+                project.add_cart_item(conn, userid, product_id, 1)
+
+        def check_out(userid):
+            with db.connection() as conn:
+                project.place_order(conn, userid)
+
+        def show(name, since=None, until=None):
+            show_fn, ranged = project.REPORTS[name]
+            with db.connection() as conn:
+                show_fn(conn.cursor(), *((since, until) if ranged else ()))
+            project.pyplot().close("all")
+
+        results = {
+            "add_to_cart": timed(add_to_cart, [(userid, rng.choice(product_ids)) for userid in shoppers]),
+            "view_cart+recommend_product": timed(project.print_cart, [(userid,) for userid in shoppers]),
+            "check_out": timed(check_out, [(userid,) for userid in shoppers]),
+        }
+        for name in project.REPORTS:
+            results[f"show:{name}"] = timed(show, [(name,)] * chart_runs)
+        db.get_pool().close()
+
+    return {
+        "dataset": dataset or {"source": source, "orders": order_count},
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "operations": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shop workload benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stress = commands.add_parser("stress-checkout", help="concurrent checkouts against limited stock")
+    stress.add_argument("--threads", type=int, default=32)
+    stress.add_argument("--shoppers", type=int, default=1000)
+    stress.add_argument("--stock", type=int, default=100)
+
+    signup = commands.add_parser("signup", help="signup/login throughput with a large users table")
+    signup.add_argument("--users", type=int, default=1000000)
+    signup.add_argument("--signups", type=int, default=10000)
+
+    load = commands.add_parser("server-load", help="network clients checking out through the group-commit server")
+    load.add_argument("--clients", type=int, default=64)
+    load.add_argument("--rounds", type=int, default=20)
+
+    impact = commands.add_parser("backup-impact", help="checkout latency while an online backup runs")
+    impact.add_argument("--orders", type=int, default=200000, help="about 3.6M orders make a 1 GB database")
+    impact.add_argument("--threads", type=int, default=2)
+    impact.add_argument("--pages", type=int, default=backup.STEP_PAGES)
+    impact.add_argument("--sleep", type=float, default=backup.STEP_SLEEP)
+
+    batch = commands.add_parser("pricing", help="carts priced per second by the batch pricing engine")
+    batch.add_argument("--carts", type=int, default=1000000)
+    batch.add_argument("--runs", type=int, default=5)
+
+    startup = commands.add_parser("startup", help="import and cold-start time of project.py, lazy vs eager imports")
+    startup.add_argument("--runs", type=int, default=5)
+
+    suite = commands.add_parser("suite", help="time checkout, cart, recommendations and charts; prints JSON")
+    suite.add_argument("--orders", type=int, default=10000, help="orders to generate (10k to 10M)")
+    suite.add_argument("--db", help="copy this database instead of generating one")
+    suite.add_argument("--runs", type=int, default=200)
+    suite.add_argument("--chart-runs", type=int, default=5)
+    suite.add_argument("--seed", type=int, default=42)
+    suite.add_argument("--output", help="also write the JSON report to this file")
+
+    args = parser.parse_args(argv)
+    if args.command == "suite":
+        report = json.dumps(run_suite(args.orders, args.db, args.runs, args.chart_runs, args.seed), indent=2)
+        print(report)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(report + "\n")
+    if args.command == "backup-impact":
+        print(json.dumps(backup_impact(args.orders, args.threads, pages=args.pages, sleep=args.sleep), indent=2))
+    if args.command == "pricing":
+        result = pricing_throughput(args.carts, args.runs)
+        print(json.dumps(result))
+        return 0 if not result["mismatches"] else 1
+    if args.command == "startup":
+        print(json.dumps(startup_time(args.runs)))
+    if args.command == "server-load":
+        result = server_load(args.clients, args.rounds)
+        print(json.dumps(result))
+        return 0 if not result["failures"] and result["orders"] == args.clients * args.rounds else 1
+    if args.command == "signup":
+        print(json.dumps(signup_throughput(args.users, args.signups)))
+    if args.command == "stress-checkout":
+        result = stress_checkout(args.threads, args.shoppers, args.stock)
+        print(json.dumps(result))
+        consistent = result["units_sold"] == args.stock - result["final_stock"] == min(args.stock, args.shoppers)
+        return 0 if result["oversold"] == 0 and consistent and not result["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
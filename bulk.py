@@ -0,0 +1,183 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+import catalog
+import db
+import project
+
+CHUNK_SIZE = 5000
+PRODUCT_FIELDS = ["id", "sku", "name", "category", "price", "stock"]
+ORDER_FIELDS = ["id", "user_id", "products", "total_price", "discount_per", "time"]
+EXPORTS = {
+    "products": ("SELECT id, sku, name, category, price, stock FROM products ORDER BY id", PRODUCT_FIELDS),
+    "orders": ("SELECT id, user_id, products, total_price, discount_per, datetime(time, 'unixepoch', 'localtime') FROM orders ORDER BY id", ORDER_FIELDS),
+}
+
+
+def file_format(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unsupported format {fmt!r}, use csv or jsonl")
+    return fmt
+
+
+# (file line, row) pairs: CSV rows as dicts, JSONL lines as unparsed text so a bad line can be rejected on its own
+def read_rows(path, fmt=None):
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format(path, fmt) == "csv":
+            reader = csv.DictReader(f)
+            # line_num counts physical lines read so far, header included (a quoted record ends on its last line)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(f, 1):
+                if text.strip():
+                    yield line, text.strip()
+
+
+def parse_row(raw):
+    row = json.loads(raw) if isinstance(raw, str) else raw
+    if not isinstance(row, dict):
+        raise ValueError("row is not a JSON object")
+    return row
+
+
+def clean_product(row):
+    name = str(row.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    try:
+        price = float(row.get("price"))
+        stock = int(row.get("stock"))
+    except (TypeError, ValueError):
+        raise ValueError("price and stock must be numbers")
+    if not math.isfinite(price):
+        raise ValueError("price must be a finite number")
+    if price < 0 or stock < 0:
+        raise ValueError("price and stock must not be negative")
+    sku = str(row.get("sku") or "").strip() or None
+    return {"sku": sku, "name": name, "category": str(row.get("category") or "").strip(), "price": price, "stock": stock}
+
+
+def existing_ids(conn, column, values):
+    if not values:
+        return {}
+    cursor = conn.execute(f"""
+        SELECT {column}, MIN(id) FROM products
+        WHERE {column} IN (SELECT value FROM json_each(?)) GROUP BY {column}
+    """, (json.dumps(values),))
+    return dict(cursor.fetchall())
+
+
+def upsert_products(conn, rows):
+    # last row wins when a chunk names the same product twice
+    rows = list({(row["sku"] or "", row["name"] if not row["sku"] else ""): row for row in rows}.values())
+    by_sku = existing_ids(conn, "sku", [row["sku"] for row in rows if row["sku"]])
+    by_name = existing_ids(conn, "name", [row["name"] for row in rows if not row["sku"]])
+
+    updates, inserts = [], []
+    for row in rows:
+        product_id = by_sku.get(row["sku"]) if row["sku"] else by_name.get(row["name"])
+        values = (row["name"], row["category"], row["price"], row["stock"], row["sku"])
+        if product_id:
+            updates.append(values + (product_id,))
+        else:
+            inserts.append(values)
+    conn.executemany("UPDATE products SET name=?, category=?, price=?, stock=?, sku=COALESCE(?, sku) WHERE id=?", updates)
+    conn.executemany("INSERT INTO products (name, category, price, stock, sku) VALUES (?, ?, ?, ?, ?)", inserts)
+    return len(updates), len(inserts)
+
+
+def import_products(path, fmt=None, rejects_path=None, chunk_size=CHUNK_SIZE):
+    rejects_path = rejects_path or path + ".rejects.jsonl"
+    stats = {"read": 0, "updated": 0, "inserted": 0, "rejected": 0}
+    began = time.perf_counter()
+
+    def flush(chunk):
+        # the chunk reads before it writes; an immediate transaction waits for the write lock up front,
+        # where a deferred one fails with "database is locked" if another process commits in between
+        with db.transaction(immediate=True) as conn:
+            updated, inserted = upsert_products(conn, chunk)
+        stats["updated"] += updated
+        stats["inserted"] += inserted
+
+    chunk = []
+    with open(rejects_path, "w", encoding="utf-8") as rejects:
+        for line, row in read_rows(path, fmt):
+            stats["read"] += 1
+            try:
+                row = parse_row(row)
+                chunk.append(clean_product(row))
+            except ValueError as e:
+                stats["rejected"] += 1
+                rejects.write(json.dumps({"line": line, "error": str(e), "row": row}) + "\n")
+                continue
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    if not stats["rejected"]:
+        os.remove(rejects_path)
+    catalog.products.clear()
+
+    elapsed = time.perf_counter() - began
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["read"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def export_table(table, path, fmt=None):
+    query, fields = EXPORTS[table]
+    fmt = file_format(path, fmt)
+    rows = 0
+    began = time.perf_counter()
+    with db.connection() as conn, open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(fields)
+        cursor = conn.execute(query)
+        while True:
+            batch = cursor.fetchmany(CHUNK_SIZE)
+            if not batch:
+                break
+            if writer:
+                writer.writerows(batch)
+            else:
+                f.writelines(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n" for row in batch)
+            rows += len(batch)
+    elapsed = time.perf_counter() - began
+    return {"exported": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed, 1) if elapsed else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk product import and product/order export")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="upsert products from a CSV or JSONL file")
+    load.add_argument("path")
+    load.add_argument("--format", choices=["csv", "jsonl"])
+    load.add_argument("--rejects", help="where to write rejected rows (default: <path>.rejects.jsonl)")
+    load.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    dump = commands.add_parser("export", help="stream a table to a CSV or JSONL file")
+    dump.add_argument("table", choices=sorted(EXPORTS))
+    dump.add_argument("path")
+    dump.add_argument("--format", choices=["csv", "jsonl"])
+
+    args = parser.parse_args(argv)
+    project.create_tables()
+    if args.command == "import":
+        print(import_products(args.path, args.format, args.rejects, args.chunk_size))
+    else:
+        print(export_table(args.table, args.path, args.format))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
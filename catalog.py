@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+
+import db
+
+# most product rows kept in memory
+CACHE_SIZE = int(os.environ.get("SHOP_PRODUCT_CACHE", "10000"))
+
+PRODUCT_COLUMNS = "id, name, category, price, stock"
+
+
+# read-through LRU of (id, name, category, price, stock) rows plus category -> ids lists
+class ProductCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._categories = {}
+        self._path = None
+        # bumped by every invalidation so a read that raced a write is not cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _check_database(self):
+        # a different database (scripts, benchmarks) starts from an empty cache
+        path = db.get_pool().path
+        if path != self._path:
+            self._generation += 1
+            self._rows.clear()
+            self._categories.clear()
+            self._path = path
+
+    def get_many(self, cursor, product_ids):
+        found, missing = {}, []
+        with self._lock:
+            self._check_database()
+            for product_id in product_ids:
+                row = self._rows.get(product_id)
+                if row is None:
+                    missing.append(product_id)
+                else:
+                    self._rows.move_to_end(product_id)
+                    found[product_id] = row
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+        if missing:
+            placeholders = ', '.join(['?'] * len(missing))
+            cursor.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id IN ({placeholders})", missing)
+            rows = cursor.fetchall()
+            with self._lock:
+                for row in rows:
+                    if generation == self._generation:
+                        self._store(row)
+                    found[row[0]] = row
+        return found
+
+    def get(self, cursor, product_id):
+        return self.get_many(cursor, [product_id]).get(product_id)
+
+    def category_ids(self, cursor, category):
+        with self._lock:
+            self._check_database()
+            ids = self._categories.get(category)
+            if ids is not None:
+                self.hits += 1
+                return ids
+            self.misses += 1
+            generation = self._generation
+        cursor.execute("SELECT id FROM products WHERE category = ? ORDER BY id", (category,))
+        ids = tuple(row[0] for row in cursor.fetchall())
+        with self._lock:
+            if generation == self._generation:
+                self._categories[category] = ids
+        return ids
+
+    def _store(self, row):
+        self._rows[row[0]] = row
+        self._rows.move_to_end(row[0])
+        while len(self._rows) > self.size:
+            self._rows.popitem(last=False)
+
+    # call after a committed write; categories are the ones whose id lists changed
+    def invalidate(self, product_ids=(), categories=()):
+        with self._lock:
+            self._generation += 1
+            for product_id in product_ids:
+                self._rows.pop(product_id, None)
+            for category in categories:
+                self._categories.pop(category, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._rows.clear()
+            self._categories.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._rows), "capacity": self.size,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+products = ProductCache()
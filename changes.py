@@ -0,0 +1,88 @@
+import time
+
+import db
+
+# changes handled per transaction by consume()
+BATCH_SIZE = 1000
+NOTIFIER = "wishlist-alerts"
+
+CHANGE_COLUMNS = "seq, product_id, old_price, new_price, old_stock, new_stock, changed_at"
+
+
+# [(seq, product_id, old_price, new_price, old_stock, new_stock, changed_at)] after a sequence number
+def read(cursor, after_seq=0, limit=BATCH_SIZE):
+    return cursor.execute(f"SELECT {CHANGE_COLUMNS} FROM product_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                          (after_seq, limit)).fetchall()
+
+
+def position(cursor, consumer):
+    row = cursor.execute("SELECT seq FROM change_cursors WHERE consumer = ?", (consumer,)).fetchone()
+    return row[0] if row else 0
+
+
+def advance(cursor, consumer, seq):
+    cursor.execute("""
+        INSERT INTO change_cursors (consumer, seq) VALUES (?, ?)
+        ON CONFLICT(consumer) DO UPDATE SET seq = excluded.seq
+    """, (consumer, seq))
+
+
+# hand one batch after the consumer's cursor to handler(cursor, changes) and move the cursor past it,
+# in the caller's transaction; returns how many changes were handled
+def consume_batch(cursor, consumer, handler, batch_size=BATCH_SIZE):
+    changes = read(cursor, position(cursor, consumer), batch_size)
+    if changes:
+        handler(cursor, changes)
+        advance(cursor, consumer, changes[-1][0])
+    return len(changes)
+
+
+# drain the feed for one consumer, a transaction per batch
+def consume(consumer, handler, batch_size=BATCH_SIZE):
+    handled = 0
+    while True:
+        with db.transaction(immediate=True) as conn:
+            count = consume_batch(conn.cursor(), consumer, handler, batch_size)
+        handled += count
+        if count < batch_size:
+            return handled
+
+
+# turn a batch of changes into alerts for everyone who wishlisted the product
+def notify_wishlists(cursor, changes):
+    # net effect per product across the batch: first old price, last values, and whether it sold out
+    net = {}
+    for seq, product_id, old_price, new_price, old_stock, new_stock, _ in changes:
+        first_price, sold_out = net[product_id][1:3] if product_id in net else (old_price, False)
+        sold_out = sold_out or (old_stock or 0) <= 0 or (new_stock or 0) <= 0
+        net[product_id] = (seq, first_price, sold_out, new_price, new_stock)
+    events = []
+    for product_id, (seq, old_price, sold_out, new_price, new_stock) in net.items():
+        if old_price is not None and new_price is not None and new_price < old_price:
+            events.append((product_id, "price_drop", old_price, new_price, seq))
+        if sold_out and (new_stock or 0) > 0:
+            events.append((product_id, "back_in_stock", 0, new_stock, seq))
+    now = int(time.time())
+    # one indexed lookup on wishlist(product_id) per event
+    cursor.executemany("""
+        INSERT INTO wishlist_alerts (user_id, product_id, kind, old_value, new_value, seq, created_at)
+        SELECT user_id, ?, ?, ?, ?, ?, ? FROM wishlist WHERE product_id = ?
+    """, [(product_id, kind, old, new, seq, now, product_id) for product_id, kind, old, new, seq in events])
+
+
+def run_notifier(batch_size=BATCH_SIZE):
+    return consume(NOTIFIER, notify_wishlists, batch_size)
+
+
+# [(alert id, product id, product name, kind, old value, new value, created at)] newest first
+def unseen_alerts(cursor, user_id):
+    return cursor.execute("""
+        SELECT a.id, a.product_id, p.name, a.kind, a.old_value, a.new_value, a.created_at
+        FROM wishlist_alerts a JOIN products p ON p.id = a.product_id
+        WHERE a.user_id = ? AND a.seen = 0
+        ORDER BY a.id DESC
+    """, (user_id,)).fetchall()
+
+
+def mark_seen(cursor, user_id, last_id):
+    cursor.execute("UPDATE wishlist_alerts SET seen = 1 WHERE user_id = ? AND seen = 0 AND id <= ?", (user_id, last_id))
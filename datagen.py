@@ -0,0 +1,117 @@
+import argparse
+import datetime
+import sys
+import time
+
+import numpy as np
+
+import db
+import pricing
+import project
+import recommendations
+
+CATEGORIES = ["Electronics", "Accessories", "Clothing", "Footwear", "Books", "Kitchen", "Toys", "Sports",
+              "Beauty", "Grocery", "Garden", "Office", "Music", "Health", "Furniture", "Pets", "Tools",
+              "Automotive", "Jewellery", "Stationery"]
+# relative order volume per hour of day: quiet nights, busy afternoons and evenings
+HOURLY_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 3, 5, 7, 9, 10, 11, 12, 12, 11, 10, 10, 11, 12, 12, 10, 7, 4, 2], dtype=float)
+CHUNK = 50000
+
+
+# fill an empty database; product popularity and shopper activity follow a Zipf-like skew
+def generate(orders=10000, users=None, products=None, days=365, seed=42, skew=1.1):
+    users = users or max(100, orders // 5)
+    products = products or max(50, orders // 50)
+    rng = np.random.default_rng(seed)
+    began = time.perf_counter()
+
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO users (id, name, email, password, role) VALUES (?, ?, ?, ?, 'user')",
+                         ((i, f"Shopper {i}", f"shopper{i}@example.com", f"pass{i}") for i in range(1, users + 1)))
+        prices = np.round(np.exp(rng.normal(6.5, 1.2, products)), -1).clip(10, 200000)
+        stocks = rng.integers(0, 500, products)
+        categories = rng.integers(0, len(CATEGORIES), products)
+        conn.executemany("INSERT INTO products (id, name, category, price, stock) VALUES (?, ?, ?, ?, ?)",
+                         ((i + 1, f"{CATEGORIES[categories[i]]} Item {i + 1}", CATEGORIES[categories[i]],
+                           float(prices[i]), int(stocks[i])) for i in range(products)))
+
+    product_weights = 1 / np.arange(1, products + 1) ** skew
+    product_weights /= product_weights.sum()
+    user_weights = 1 / np.arange(1, users + 1) ** (skew / 2)
+    user_weights /= user_weights.sum()
+    hour_weights = HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum()
+    price_list = pricing.default()
+    names = [f"{CATEGORIES[c]} Item {i + 1}" for i, c in enumerate(categories)]
+    # local midnight, so the hour-of-day skew lands on local hours
+    start = int(datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days), datetime.time()).timestamp())
+
+    for first in range(0, orders, CHUNK):
+        size = min(CHUNK, orders - first)
+        buyers = rng.choice(users, size, p=user_weights) + 1
+        offsets = (rng.integers(0, days, size) * 86400 + rng.choice(24, size, p=hour_weights) * 3600
+                   + rng.integers(0, 3600, size))
+        line_counts = 1 + np.minimum(rng.poisson(1.5, size), 5)
+        picks = rng.choice(products, int(line_counts.sum()), p=product_weights)
+        quantities = 1 + rng.poisson(0.3, len(picks))
+
+        order_rows, item_rows, carts, at = [], [], [], 0
+        for n in range(size):
+            lines = {}
+            for k in range(at, at + line_counts[n]):
+                lines[int(picks[k])] = int(quantities[k])
+            at += line_counts[n]
+            carts.append(lines)
+        # every order in the chunk is priced in one batch, the way checkout prices a single cart
+        priced = price_list.price([prices[p] for lines in carts for p in lines],
+                                  [q for lines in carts for q in lines.values()], [len(lines) for lines in carts])
+        for n, lines in enumerate(carts):
+            order_id = first + n + 1
+            label = ", ".join(f"{names[p]} (x{q})" for p, q in lines.items())
+            order_rows.append((order_id, int(buyers[n]), label, int(priced.total[n]) / 100,
+                               price_list.percents[priced.tier[n]], start + int(offsets[n])))
+            item_rows.extend((order_id, p + 1, q, float(prices[p])) for p, q in lines.items())
+        with db.transaction() as conn:
+            conn.executemany("INSERT INTO orders (id, user_id, products, total_price, discount_per, time) VALUES (?, ?, ?, ?, ?, ?)", order_rows)
+            conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)", item_rows)
+
+    # carts for a tenth of the shoppers, wishlists for a fifth
+    cart_rows = {(int(u) + 1, int(p) + 1): int(q) for u, p, q in zip(
+        rng.choice(users, users // 10), rng.choice(products, users // 10, p=product_weights), 1 + rng.poisson(0.5, users // 10))}
+    wishlist_rows = set(zip((rng.choice(users, users // 5) + 1).tolist(), (rng.choice(products, users // 5, p=product_weights) + 1).tolist()))
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)", [k + (q,) for k, q in cart_rows.items()])
+        conn.executemany("INSERT INTO wishlist (user_id, product_id) VALUES (?, ?)", sorted(wishlist_rows))
+        # derived tables the migrations normally fill from history
+        project.rebuild_revenue_rollups(conn)
+        project.rebuild_sales_rollups(conn)
+        project.rebuild_period_units(conn)
+        conn.execute("DELETE FROM co_purchases")
+        recommendations.backfill(conn)
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        # planner statistics; the migrations analyzed empty tables
+        conn.execute("ANALYZE")
+
+    return {"users": users, "products": products, "orders": orders, "seconds": round(time.perf_counter() - began, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill an empty shop database with synthetic data")
+    parser.add_argument("path", help="database file to create")
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    db.configure(args.path)
+    project.create_tables()
+    with db.connection() as conn:
+        if conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone():
+            parser.error(f"{args.path} already has orders")
+    print(generate(args.orders, args.users, args.products, args.days, args.seed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+# connection settings (override with environment variables)
+DB_PATH = os.environ.get("SHOP_DB", "inventory.db")
+POOL_SIZE = int(os.environ.get("SHOP_POOL_SIZE", "4"))
+BUSY_TIMEOUT = float(os.environ.get("SHOP_BUSY_TIMEOUT", "5"))
+STATEMENT_CACHE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def connect(path=None):
+    # autocommit mode: transactions are opened explicitly with transaction()
+    # statements are timed by metrics.Connection unless SHOP_METRICS=0
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT, isolation_level=None,
+                           check_same_thread=False, cached_statements=STATEMENT_CACHE,
+                           factory=metrics.Connection if metrics.ENABLED else sqlite3.Connection)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path=None, size=None):
+        self.path = path or DB_PATH
+        self.size = size or POOL_SIZE
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._all = []
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = connect(self.path)
+                self._created += 1
+                self._all.append(conn)
+                return conn
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._created = 0
+            self._idle = queue.LifoQueue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def configure(path=None, size=None):
+    # point the shared pool at another database (scripts, benchmarks)
+    global _pool, DB_PATH
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        if path:
+            DB_PATH = path
+        _pool = ConnectionPool(path, size)
+    return _pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+def transaction(immediate=False):
+    return get_pool().transaction(immediate)
+
+
+# apply numbered migrations (1-based list positions) not yet recorded in user_version
+def migrate(migrations):
+    with connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        while version < len(migrations):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # another process may have migrated while we waited for the lock
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < len(migrations):
+                    migrations[version](conn)
+                    version += 1
+                    conn.execute(f"PRAGMA user_version = {version}")
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+    return version
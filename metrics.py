@@ -0,0 +1,226 @@
+import atexit
+import datetime
+import functools
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# instrumentation settings (override with environment variables)
+ENABLED = os.environ.get("SHOP_METRICS", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SHOP_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("SHOP_SLOW_QUERY_LOG", "slow_queries.log")
+# when set, the collected metrics are written here as JSON at exit
+DUMP_PATH = os.environ.get("SHOP_METRICS_FILE")
+
+# histogram buckets start at 10 microseconds and grow by 2^(1/4), about 19% apart, up to ~5 minutes
+BUCKET_START = 1e-5
+BUCKETS_PER_DOUBLING = 4
+BUCKETS = 100
+
+# statements worth an EXPLAIN QUERY PLAN in the slow-query log
+PLANNED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def add(self, seconds, rows=0):
+        bucket = 0
+        if seconds > BUCKET_START:
+            bucket = min(BUCKETS - 1, math.ceil(BUCKETS_PER_DOUBLING * math.log2(seconds / BUCKET_START)))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.rows += rows
+        self.max = max(self.max, seconds)
+
+    # upper edge of the bucket holding the q-th fraction of samples, capped at the slowest sample
+    def percentile(self, q):
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKET_START * 2 ** (bucket / BUCKETS_PER_DOUBLING), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+# normalized statement text -> Histogram, operation name -> Histogram
+statements = {}
+operations = {}
+_keys = {}
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+# one key per statement shape: whitespace collapsed, "IN (?, ?, ?)" lists folded
+def statement_key(sql):
+    key = _keys.get(sql)
+    if key is None:
+        key = re.sub(r"\?(\s*,\s*\?)+", "?, ...", " ".join(sql.split()))
+        if len(_keys) < 4096:
+            _keys[sql] = key
+    return key
+
+
+def record_statement(key, seconds, rows=0):
+    with _lock:
+        histogram = statements.get(key)
+        if histogram is None:
+            histogram = statements[key] = Histogram()
+        histogram.add(seconds, rows)
+
+
+def add_rows(key, rows):
+    with _lock:
+        statements[key].rows += rows
+
+
+def record_operation(name, seconds):
+    with _lock:
+        histogram = operations.get(name)
+        if histogram is None:
+            histogram = operations[name] = Histogram()
+        histogram.add(seconds)
+
+
+@contextmanager
+def operation(name):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        if ENABLED:
+            record_operation(name, time.perf_counter() - began)
+
+
+# decorator form of operation()
+def timed(name):
+    def wrap(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            with operation(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return wrap
+
+
+def log_slow_query(conn, sql, params, seconds):
+    plan = []
+    if sql.lstrip()[:7].upper().startswith(PLANNED):
+        try:
+            # a plain cursor, so the EXPLAIN itself is not recorded
+            plan = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            plan = [(0, 0, 0, f"(no plan: {e})")]
+    lines = [f"-- {datetime.datetime.now():%Y-%m-%d %H:%M:%S} {seconds * 1000:.1f} ms", " ".join(sql.split())]
+    lines += [f"   {row[3]}" for row in plan]
+    with _log_lock:
+        with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n\n")
+
+
+# cursor that times execute() (through the first row) and counts the rows it returns or changes
+class Cursor(sqlite3.Cursor):
+    _key = None
+
+    def execute(self, sql, params=()):
+        began = time.perf_counter()
+        super().execute(sql, params)
+        self._finish(sql, params, time.perf_counter() - began)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        if not isinstance(seq_of_params, (list, tuple)):
+            seq_of_params = list(seq_of_params)
+        began = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self._finish(sql, seq_of_params[0] if seq_of_params else (), time.perf_counter() - began)
+        return self
+
+    def _finish(self, sql, params, seconds):
+        self._key = statement_key(sql)
+        record_statement(self._key, seconds, max(self.rowcount, 0))
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            log_slow_query(self.connection, sql, params, seconds)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self._key:
+            add_rows(self._key, 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._key:
+            add_rows(self._key, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._key:
+            add_rows(self._key, len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        if self._key:
+            add_rows(self._key, 1)
+        return row
+
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    # the shortcut methods build their cursor in C, bypassing cursor()
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def snapshot(limit=None):
+    with _lock:
+        ops = {name: histogram.summary() for name, histogram in sorted(operations.items())}
+        stmts = sorted(((key, histogram.summary()) for key, histogram in statements.items()),
+                       key=lambda item: -item[1]["total_ms"])
+    return {"operations": ops, "statements": dict(stmts[:limit] if limit else stmts)}
+
+
+def reset():
+    with _lock:
+        statements.clear()
+        operations.clear()
+
+
+def dump(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2)
+
+
+if ENABLED and DUMP_PATH:
+    atexit.register(dump, DUMP_PATH)
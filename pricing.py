@@ -0,0 +1,125 @@
+import collections
+import os
+from decimal import Decimal
+
+import numpy as np
+
+# checkout discount ladder as "minimum subtotal:percent" pairs (override with SHOP_DISCOUNT_TIERS)
+DISCOUNT_TIERS = os.environ.get("SHOP_DISCOUNT_TIERS", "0:0,500:5,1000:10,2000:15")
+
+# money is priced in integer paise, so totals are exact; discounts round half up to the paisa
+Prices = collections.namedtuple("Prices", "subtotal tier discount total")
+Quote = collections.namedtuple("Quote", "lines subtotal percent discount total")
+
+
+def parse_tiers(text):
+    tiers = []
+    for pair in text.split(","):
+        minimum, percent = pair.split(":")
+        tiers.append((Decimal(minimum.strip()), Decimal(percent.strip())))
+    return tiers
+
+
+def to_paise(amounts):
+    return np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+
+def to_rupees(paise):
+    return Decimal(int(paise)).scaleb(-2)
+
+
+# a discount ladder compiled to sorted tier floors in paise and rates in basis points
+class PriceList:
+    def __init__(self, tiers):
+        tiers = sorted((Decimal(minimum), Decimal(percent)) for minimum, percent in tiers)
+        if not tiers or tiers[0][0] > 0:
+            tiers.insert(0, (Decimal(0), Decimal(0)))
+        if any(percent < 0 or percent > 100 for _, percent in tiers):
+            raise ValueError("discount percentages must be between 0 and 100")
+        self.tiers = tiers
+        self.floors = np.array([int(minimum * 100) for minimum, _ in tiers], dtype=np.int64)
+        self.rates = np.array([int(percent * 100) for _, percent in tiers], dtype=np.int64)
+        # the value stored in orders.discount_per: whole percentages stay integers
+        self.percents = [int(percent) if percent == int(percent) else float(percent) for _, percent in tiers]
+
+    # subtotals in paise -> Prices of paise arrays and tier indexes into self.tiers / self.percents
+    def apply(self, subtotals):
+        subtotals = np.asarray(subtotals, dtype=np.int64)
+        tier = np.searchsorted(self.floors, subtotals, side="right") - 1
+        discount = (subtotals * self.rates[tier] + 5000) // 10000
+        return Prices(subtotals, tier, discount, subtotals - discount)
+
+    # price a batch of carts given as flat line arrays; lengths[i] is the number of lines in cart i
+    def price(self, prices, quantities, lengths):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        lines = to_paise(prices) * np.asarray(quantities, dtype=np.int64)
+        # cart subtotals as differences of a running sum, which also handles empty carts
+        running = np.concatenate(([0], np.cumsum(lines)))
+        ends = np.cumsum(lengths)
+        return self.apply(running[ends] - running[ends - lengths])
+
+    # one cart of (unit price, quantity) lines as exact rupee Decimals
+    def quote(self, lines):
+        unit_prices, quantities = [line[0] for line in lines], [line[1] for line in lines]
+        prices = self.price(unit_prices, quantities, [len(lines)])
+        amounts = to_paise(unit_prices) * np.asarray(quantities, dtype=np.int64)
+        return Quote([to_rupees(amount) for amount in amounts], to_rupees(prices.subtotal[0]),
+                     self.percents[prices.tier[0]], to_rupees(prices.discount[0]), to_rupees(prices.total[0]))
+
+
+_default = None
+
+
+# the shop's price list, compiled once
+def default():
+    global _default
+    if _default is None:
+        _default = PriceList(parse_tiers(DISCOUNT_TIERS))
+    return _default
+
+
+# (order lengths, unit prices, quantities, recorded totals) of the orders in since <= time < until, archive included
+def order_lines(cursor, since=None, until=None):
+    import analytics
+    cold = analytics.cold_storage()
+    where, params = analytics.time_filter("o.time", analytics.hot_since(cold, since) if cold else since, until)
+    order_ids, prices, quantities, totals = [], [], [], []
+    rows = cursor.execute(f"""
+        SELECT oi.order_id, oi.unit_price, oi.quantity FROM orders o CROSS JOIN order_items oi ON oi.order_id = o.id
+        WHERE {where}
+    """, params).fetchall()
+    if rows:
+        order_ids.append(np.array([row[0] for row in rows], dtype=np.int64))
+        prices.append(np.array([row[1] for row in rows], dtype=np.float64))
+        quantities.append(np.array([row[2] for row in rows], dtype=np.int64))
+    totals.append(cursor.execute(f"SELECT COALESCE(SUM(total_price), 0) FROM orders o WHERE {where}", params).fetchone()[0])
+    if cold:
+        since, until = analytics.to_epoch(since), analytics.to_epoch(until)
+        for month, info in cold.partitions(since, until):
+            orders, items = cold.load(month, "orders"), cold.load(month, "items")
+            order_mask, item_mask = cold.in_range(info, orders["time"], since, until), cold.in_range(info, items["time"], since, until)
+            totals.append(float((orders["total_price"] if order_mask is None else orders["total_price"][order_mask]).sum()))
+            for out, column in ((order_ids, "order_id"), (prices, "unit_price"), (quantities, "quantity")):
+                out.append(items[column] if item_mask is None else items[column][item_mask])
+    if not order_ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64), sum(totals)
+    order_ids = np.concatenate(order_ids)
+    # group each order's lines together
+    order = np.argsort(order_ids, kind="stable")
+    _, lengths = np.unique(order_ids[order], return_counts=True)
+    return lengths, np.concatenate(prices)[order], np.concatenate(quantities)[order], sum(totals)
+
+
+# what the orders in a date range would have cost under another price list, next to what they did cost
+def replay(cursor, price_list, since=None, until=None):
+    lengths, prices, quantities, recorded = order_lines(cursor, since, until)
+    priced = price_list.price(prices, quantities, lengths)
+    tiers = np.bincount(priced.tier, minlength=len(price_list.tiers))
+    return {
+        "orders": len(lengths),
+        "subtotal": str(to_rupees(priced.subtotal.sum())),
+        "discount": str(to_rupees(priced.discount.sum())),
+        "total": str(to_rupees(priced.total.sum())),
+        "recorded_total": str(to_rupees(to_paise(recorded))),
+        "orders_by_discount": {str(percent): int(count) for percent, count in zip(price_list.percents, tiers)},
+    }
@@ -1,12 +1,48 @@
-import sqlite3
-import datetime
-import matplotlib.pyplot as plt
-import numpy as np
-from tabulate import tabulate
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shlex
+import sys
+import time
+
+import analytics
+import auth
+import catalog
+import changes
+import db
+import metrics
+import recommendations
+
+# seconds a cart line holds its stock for the shopper (0 disables reservations)
+RESERVATION_TTL = int(os.environ.get("SHOP_RESERVATION_TTL", "0"))
+
+# headless mode renders charts to files instead of opening a window (default on displayless Linux)
+NO_DISPLAY = sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+HEADLESS = os.environ.get("SHOP_HEADLESS", "1" if NO_DISPLAY else "0") == "1"
+REPORT_DIR = os.environ.get("SHOP_REPORT_DIR", "reports")
+REPORT_FORMAT = os.environ.get("SHOP_REPORT_FORMAT", "png")
+
+# plotting, table rendering and the numpy-based modules (archive, pricing, analytics arrays) are imported
+# on first use, inside the functions that need them; most sessions never draw a chart
+def pyplot():
+    import matplotlib
+    if HEADLESS:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def tabulate(rows, **kwargs):
+    from tabulate import tabulate as render
+    return render(rows, **kwargs)
 
 # table definitions
 def create_tables():
-    conn = sqlite3.connect("inventory.db")
+    return db.migrate(MIGRATIONS)
+
+def create_schema(conn):
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -55,10 +91,353 @@ def create_tables():
         FOREIGN KEY(user_id) REFERENCES users(id)
     )""")
 
-    conn.commit()
-    conn.close()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS order_items (
+        order_id INTEGER,
+        product_id INTEGER,
+        quantity INTEGER,
+        unit_price REAL,
+        FOREIGN KEY(order_id) REFERENCES orders(id),
+        FOREIGN KEY(product_id) REFERENCES products(id)
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id, quantity, unit_price)")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reservations (
+        user_id INTEGER,
+        product_id INTEGER,
+        quantity INTEGER,
+        expires_at REAL,
+        PRIMARY KEY(user_id, product_id)
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservations_product ON reservations(product_id, expires_at)")
+
+    # revenue rollups, kept current by checkout
+    for table, key in REVENUE_ROLLUPS:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {key} TEXT PRIMARY KEY,
+            revenue REAL NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0
+        )""")
+
+# rollup table, period column, and the SQLite strftime format of the period
+REVENUE_ROLLUPS = [("revenue_daily", "day"), ("revenue_weekly", "week"), ("revenue_monthly", "month")]
+REVENUE_PERIODS = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+
+def record_revenue(cursor, order_time, amount):
+    for table, key in REVENUE_ROLLUPS:
+        cursor.execute(f"""
+            INSERT INTO {table} ({key}, revenue, orders) VALUES (strftime(?, ?, 'unixepoch', 'localtime'), ?, 1)
+            ON CONFLICT({key}) DO UPDATE SET revenue = revenue + excluded.revenue, orders = orders + 1
+        """, (REVENUE_PERIODS[key], order_time, amount))
+
+# orders per local day and hour, and units sold per product (tables from migration 10), kept current by checkout
+def record_sales(cursor, order_time, lines):
+    cursor.execute("""
+        INSERT INTO order_hours (day, hour, orders)
+        VALUES (strftime('%Y-%m-%d', ?, 'unixepoch', 'localtime'), CAST(strftime('%H', ?, 'unixepoch', 'localtime') AS INTEGER), 1)
+        ON CONFLICT(day, hour) DO UPDATE SET orders = orders + 1
+    """, (order_time, order_time))
+    cursor.executemany("""
+        INSERT INTO product_units (product_id, units) VALUES (?, ?)
+        ON CONFLICT(product_id) DO UPDATE SET units = units + excluded.units
+    """, lines)
+
+def rebuild_sales_rollups(conn):
+    conn.execute("DELETE FROM order_hours")
+    conn.execute("""
+        INSERT INTO order_hours (day, hour, orders)
+        SELECT strftime('%Y-%m-%d', time, 'unixepoch', 'localtime') AS day,
+               CAST(strftime('%H', time, 'unixepoch', 'localtime') AS INTEGER) AS hour, COUNT(*)
+        FROM orders WHERE time IS NOT NULL GROUP BY day, hour
+    """)
+    conn.execute("DELETE FROM product_units")
+    conn.execute("""
+        INSERT INTO product_units (product_id, units)
+        SELECT product_id, SUM(quantity) FROM order_items WHERE product_id IS NOT NULL GROUP BY product_id
+    """)
+    # archived orders are gone from the orders tables but still count
+    import archive
+    if archive.cutoff() is not None:
+        conn.executemany("""
+            INSERT INTO order_hours (day, hour, orders) VALUES (?, ?, ?)
+            ON CONFLICT(day, hour) DO UPDATE SET orders = orders + excluded.orders
+        """, [(period[:10], int(period[11:]), orders) for period, (_, orders) in archive.revenue("%Y-%m-%d %H").items()])
+        ids, units = archive.product_units()
+        conn.executemany("""
+            INSERT INTO product_units (product_id, units) VALUES (?, ?)
+            ON CONFLICT(product_id) DO UPDATE SET units = units + excluded.units
+        """, zip(ids.tolist(), units.tolist()))
+
+# units per product by local day and month (migration 11), for date-ranged best sellers
+PRODUCT_ROLLUPS = [("product_units_daily", "day"), ("product_units_monthly", "month")]
+
+def record_period_units(cursor, order_time, lines):
+    for table, key in PRODUCT_ROLLUPS:
+        cursor.executemany(f"""
+            INSERT INTO {table} ({key}, product_id, units) VALUES (strftime(?, ?, 'unixepoch', 'localtime'), ?, ?)
+            ON CONFLICT({key}, product_id) DO UPDATE SET units = units + excluded.units
+        """, [(REVENUE_PERIODS[key], order_time, product_id, quantity) for product_id, quantity in lines])
+
+def rebuild_period_units(conn):
+    import archive
+    for table, key in PRODUCT_ROLLUPS:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} ({key}, product_id, units)
+            SELECT strftime(?, o.time, 'unixepoch', 'localtime') AS period, oi.product_id, SUM(oi.quantity)
+            FROM orders o CROSS JOIN order_items oi ON oi.order_id = o.id
+            WHERE o.time IS NOT NULL AND oi.product_id IS NOT NULL GROUP BY period, oi.product_id
+        """, (REVENUE_PERIODS[key],))
+        if archive.cutoff() is not None:
+            conn.executemany(f"""
+                INSERT INTO {table} ({key}, product_id, units) VALUES (?, ?, ?)
+                ON CONFLICT({key}, product_id) DO UPDATE SET units = units + excluded.units
+            """, archive.period_product_units(REVENUE_PERIODS[key]))
+
+def rebuild_revenue_rollups(conn):
+    for table, key in REVENUE_ROLLUPS:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} ({key}, revenue, orders)
+            SELECT strftime(?, time, 'unixepoch', 'localtime') AS period, SUM(total_price), COUNT(*)
+            FROM orders WHERE time IS NOT NULL GROUP BY period
+        """, (REVENUE_PERIODS[key],))
+    # archived orders are gone from the orders table but still count
+    import archive
+    if archive.cutoff() is not None:
+        for table, key in REVENUE_ROLLUPS:
+            conn.executemany(f"""
+                INSERT INTO {table} ({key}, revenue, orders) VALUES (?, ?, ?)
+                ON CONFLICT({key}) DO UPDATE SET revenue = revenue + excluded.revenue, orders = orders + excluded.orders
+            """, [(period, revenue, orders) for period, (revenue, orders) in archive.revenue(REVENUE_PERIODS[key]).items()])
+
+# one-shot migration from the old "Pen (x2), Book (x1)" orders.products strings
+ORDER_LINE = re.compile(r"(.+?) \(x(\d+)\)(?:, |$)")
+
+def backfill_order_items(conn):
+    products = {name: (id, price) for id, name, price in conn.execute("SELECT id, name, price FROM products")}
+    items = []
+    for order_id, products_str in conn.execute("SELECT id, products FROM orders WHERE products IS NOT NULL"):
+        for name, quantity in ORDER_LINE.findall(products_str):
+            if name in products:
+                product_id, price = products[name]
+                items.append((order_id, product_id, int(quantity), price))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)", items)
+    return len(items)
+
+# schema migrations, applied once each in order and tracked in PRAGMA user_version
+def migration_1_base_schema(conn):
+    create_schema(conn)
+    if not conn.execute("SELECT 1 FROM order_items LIMIT 1").fetchone():
+        backfill_order_items(conn)
+    rebuild_revenue_rollups(conn)
+
+def migration_2_lookup_indexes(conn):
+    # merge duplicate cart lines and wishlist entries before making them unique
+    conn.execute("""
+        UPDATE cart SET quantity = (SELECT SUM(c.quantity) FROM cart c
+                                    WHERE c.user_id = cart.user_id AND c.product_id = cart.product_id)
+        WHERE rowid IN (SELECT MIN(rowid) FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1)
+    """)
+    conn.execute("DELETE FROM cart WHERE rowid NOT IN (SELECT MIN(rowid) FROM cart GROUP BY user_id, product_id)")
+    conn.execute("DELETE FROM wishlist WHERE rowid NOT IN (SELECT MIN(rowid) FROM wishlist GROUP BY user_id, product_id)")
+    conn.execute("CREATE UNIQUE INDEX idx_cart_user_product ON cart(user_id, product_id)")
+    conn.execute("CREATE UNIQUE INDEX idx_wishlist_user_product ON wishlist(user_id, product_id)")
+    conn.execute("CREATE INDEX idx_orders_time ON orders(time)")
+    conn.execute("CREATE INDEX idx_products_category ON products(category)")
+    conn.execute("CREATE INDEX idx_products_stock ON products(stock)")
+
+def migration_3_product_sku(conn):
+    # bulk imports upsert by SKU, or by name when a row has none
+    conn.execute("ALTER TABLE products ADD COLUMN sku TEXT")
+    conn.execute("CREATE UNIQUE INDEX idx_products_sku ON products(sku)")
+    conn.execute("CREATE INDEX idx_products_name ON products(name)")
+
+def migration_4_co_purchases(conn):
+    # how many orders contained both products, counted in both directions
+    conn.execute("""
+    CREATE TABLE co_purchases (
+        product_id INTEGER,
+        other_id INTEGER,
+        orders INTEGER NOT NULL,
+        PRIMARY KEY(product_id, other_id)
+    ) WITHOUT ROWID""")
+    recommendations.backfill(conn)
+
+def migration_5_product_search(conn):
+    # full-text index over name and category, kept in step with products by triggers
+    conn.execute("""
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, category, content='products', content_rowid='id', prefix='2 3'
+    )""")
+    conn.execute("""
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""")
+    conn.execute("""
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+    END""")
+    conn.execute("""
+    CREATE TRIGGER products_fts_update AFTER UPDATE OF name, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+        INSERT INTO products_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""")
+    conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+def migration_6_epoch_order_times(conn):
+    # orders.time was local "YYYY-MM-DD HH:MM:SS" text; rebuild the table with epoch seconds
+    conn.execute("""
+    CREATE TABLE orders_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        products TEXT,
+        total_price REAL,
+        discount_per INTEGER,
+        time INTEGER,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )""")
+    conn.execute("""
+        INSERT INTO orders_new (id, user_id, products, total_price, discount_per, time)
+        SELECT id, user_id, products, total_price, discount_per, CAST(strftime('%s', time, 'utc') AS INTEGER)
+        FROM orders
+    """)
+    conn.execute("DROP TABLE orders")
+    conn.execute("ALTER TABLE orders_new RENAME TO orders")
+    conn.execute("CREATE INDEX idx_orders_time ON orders(time)")
+    # the rollups are rebuilt from epoch times from now on (migration 1 ran the same code on text)
+    rebuild_revenue_rollups(conn)
+
+def migration_7_order_browser_indexes(conn):
+    # equality filters seek straight into id order (the rowid ends every index); ranges use time or total
+    conn.execute("CREATE INDEX idx_orders_user ON orders(user_id)")
+    conn.execute("CREATE INDEX idx_orders_discount ON orders(discount_per)")
+    conn.execute("CREATE INDEX idx_orders_total ON orders(total_price)")
+    # statistics let the planner pick the most selective index for a filter combination
+    conn.execute("ANALYZE orders")
+
+# reorder point given to products that have none of their own
+DEFAULT_REORDER_LEVEL = 5
+
+def migration_8_low_stock_watch(conn):
+    # one row per product below its reorder level, kept current by triggers on every stock change
+    conn.execute(f"ALTER TABLE products ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT {DEFAULT_REORDER_LEVEL}")
+    conn.execute("""
+    CREATE TABLE low_stock (
+        product_id INTEGER PRIMARY KEY,
+        deficit INTEGER NOT NULL
+    )""")
+    conn.execute("CREATE INDEX idx_low_stock_deficit ON low_stock(deficit DESC, product_id)")
+    conn.execute("""
+    CREATE TRIGGER low_stock_insert AFTER INSERT ON products WHEN new.stock < new.reorder_level BEGIN
+        INSERT INTO low_stock (product_id, deficit) VALUES (new.id, new.reorder_level - new.stock);
+    END""")
+    conn.execute("""
+    CREATE TRIGGER low_stock_update AFTER UPDATE OF stock, reorder_level ON products BEGIN
+        DELETE FROM low_stock WHERE product_id = old.id AND NOT (new.stock < new.reorder_level);
+        INSERT INTO low_stock (product_id, deficit)
+        SELECT new.id, new.reorder_level - new.stock WHERE new.stock < new.reorder_level
+        ON CONFLICT(product_id) DO UPDATE SET deficit = excluded.deficit;
+    END""")
+    conn.execute("""
+    CREATE TRIGGER low_stock_delete AFTER DELETE ON products BEGIN
+        DELETE FROM low_stock WHERE product_id = old.id;
+    END""")
+    conn.execute("INSERT INTO low_stock (product_id, deficit) SELECT id, reorder_level - stock FROM products WHERE stock < reorder_level")
+
+def migration_9_product_changes(conn):
+    # append-only feed of price and stock changes, filled by a trigger on products
+    conn.execute("""
+    CREATE TABLE product_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        old_price REAL,
+        new_price REAL,
+        old_stock INTEGER,
+        new_stock INTEGER,
+        changed_at INTEGER NOT NULL
+    )""")
+    conn.execute("""
+    CREATE TRIGGER product_changes_update AFTER UPDATE OF price, stock ON products
+    WHEN old.price IS NOT new.price OR old.stock IS NOT new.stock BEGIN
+        INSERT INTO product_changes (product_id, old_price, new_price, old_stock, new_stock, changed_at)
+        VALUES (new.id, old.price, new.price, old.stock, new.stock, CAST(strftime('%s', 'now') AS INTEGER));
+    END""")
+    # last sequence number each named consumer has handled
+    conn.execute("""
+    CREATE TABLE change_cursors (
+        consumer TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL
+    )""")
+    conn.execute("""
+    CREATE TABLE wishlist_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        kind TEXT NOT NULL CHECK(kind IN ('price_drop', 'back_in_stock')),
+        old_value REAL,
+        new_value REAL,
+        seq INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        seen INTEGER NOT NULL DEFAULT 0
+    )""")
+    conn.execute("CREATE INDEX idx_wishlist_alerts_user ON wishlist_alerts(user_id, seen)")
+    # the notifier finds a changed product's watchers through this index
+    conn.execute("CREATE INDEX idx_wishlist_product ON wishlist(product_id, user_id)")
+
+def migration_10_sales_rollups(conn):
+    # peak hours and all-time best sellers no longer scan every order
+    conn.execute("""
+    CREATE TABLE order_hours (
+        day TEXT,
+        hour INTEGER,
+        orders INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, hour)
+    ) WITHOUT ROWID""")
+    conn.execute("""
+    CREATE TABLE product_units (
+        product_id INTEGER PRIMARY KEY,
+        units INTEGER NOT NULL DEFAULT 0
+    )""")
+    rebuild_sales_rollups(conn)
+
+def migration_11_period_product_units(conn):
+    # date-ranged best sellers read whole months and edge days instead of every order line in the range
+    for table, key in PRODUCT_ROLLUPS:
+        conn.execute(f"""
+        CREATE TABLE {table} (
+            {key} TEXT,
+            product_id INTEGER,
+            units INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY({key}, product_id)
+        ) WITHOUT ROWID""")
+    rebuild_period_units(conn)
+
+MIGRATIONS = [
+    migration_1_base_schema,
+    migration_2_lookup_indexes,
+    migration_3_product_sku,
+    migration_4_co_purchases,
+    migration_5_product_search,
+    migration_6_epoch_order_times,
+    migration_7_order_browser_indexes,
+    migration_8_low_stock_watch,
+    migration_9_product_changes,
+    migration_10_sales_rollups,
+    migration_11_period_product_units,
+]
+
+# menu loop: each screen returns the next screen, or (screen, *args), or None to quit
+def run_menus(screen=None):
+    state = screen or main_menu
+    while state:
+        if callable(state):
+            state = (state,)
+        state = state[0](*state[1:])
 
-# menu 
 def main_menu():
     print("\nWelcome to Inventory Management System")
     print('1. Login')
@@ -66,14 +445,14 @@ def main_menu():
     print('3. Exit')
     choice = input("Enter your choice: ")
     if choice == '1':
-        login_menu()
+        return login_menu
     elif choice == '2':
-        signup_menu()
+        return signup_menu
     elif choice=='3':
-        exit()
+        return None
     else:
         print("Invalid choice. Please enter a valid option.")
-        main_menu()
+        return main_menu
         
 # login
 def login_menu():
@@ -82,18 +461,14 @@ def login_menu():
     password = input("Enter your password: ")
     role = input("Enter your role: ")
         
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email=? AND password=? AND role=?",(email,password,role))
-    user = cursor.fetchone()
-    if user and role=='admin':
-        admin_dashboard()
-    elif user and role=='user':
-        user_dashboard(user[0])
+    user_id = auth.login(email, password, role)
+    if user_id and role=='admin':
+        return admin_dashboard
+    elif user_id and role=='user':
+        return user_dashboard, user_id
     else:
         print('Invalid credentials')
-        login_menu()
-    conn.close()
+        return login_menu
     
 # signup 
 def signup_menu():
@@ -103,58 +478,54 @@ def signup_menu():
     password = input("Enter your password: ")
     role = input("Enter your role (user/admin): ").lower()
 
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT email FROM users')
-    existing_emails = [row[0] for row in cursor.fetchall()]
+    with db.connection() as conn:
+        taken = auth.email_taken(conn.cursor(), email)
 
-    if email in existing_emails:
+    if taken:
         print('Email already exists.')
-        conn.close()
-        main_menu()
+        return main_menu
 
     if role == "admin":
         if not email.endswith("@inventory.com"):
             print("Only company emails can be used for admin accounts.")
-            conn.close()
-            main_menu()
+            return main_menu
         
         secret_key = input("Enter the admin secret key: ")
         if secret_key != "InventoryAdmin123":  
             print("Invalid admin secret key.")
-            conn.close()
-            main_menu()
+            return main_menu
 
     try:
-        cursor.execute("INSERT INTO users (name, email, password, role) VALUES (?, ?, ?, ?)", 
-                       (name, email, password, role))
-        conn.commit()
-        print("Signup successful!")
-        login_menu()
+        user_id = auth.signup(name, email, password, role)
     except:
+        user_id = None
+    if not user_id:
         print('Could not add user. Try again.')
-        main_menu()
-    conn.close()
+        return main_menu
+    print("Signup successful!")
+    return login_menu
 # admin dashboard
 def admin_dashboard():
     print("\nWelcome to Admin Dashboard")
     print('1. Manage Products')
     print('2. View Orders')
     print('3. View Analysis')
-    print('4. Exit')
+    print('4. Performance Stats')
+    print('5. Exit')
     choice = input("Enter your choice: ")
     if choice == '1':
-        manage_products()
+        return manage_products
     elif choice == '2':
-        view_orders()
+        return view_orders
     elif choice == '3':
-        view_analysis()
+        return view_analysis
     elif choice == '4':
-        main_menu()
+        return view_performance
+    elif choice == '5':
+        return main_menu
     else:
         print("Invalid choice. Please enter a valid option.")
-        admin_dashboard()
+        return admin_dashboard
 
 # admin functions
 def manage_products():
@@ -163,21 +534,24 @@ def manage_products():
     print('2. Delete Product')
     print('3. Update Product')
     print('4. View Product')
-    print('5. Exit')
+    print('5. Low Stock Watchlist')
+    print('6. Exit')
     choice = input("Enter your choice: ")
     if choice == '1':
-        add_product()
+        return add_product
     elif choice == '2':
-        delete_product()
+        return delete_product
     elif choice == '3':
-        update_product()
+        return update_product
     elif choice =='4':
-        view_product()
+        return view_product
     elif choice == '5':
-        admin_dashboard()
+        return view_low_stock
+    elif choice == '6':
+        return admin_dashboard
     else:
         print("Invalid choice. Please enter a valid option.")
-        manage_products()
+        return manage_products
 def add_product():
     print("Adding product\n")
     name = input('Enter product name : ')
@@ -185,143 +559,345 @@ def add_product():
     price = int(input('Enter product price : '))
     stock = input('Enter product stock : ')
     
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO products (name,category,price,stock) VALUES (?,?,?,?)",(name,category,price,stock))
+        with db.connection() as conn:
+            conn.execute("INSERT INTO products (name,category,price,stock) VALUES (?,?,?,?)",(name,category,price,stock))
+        catalog.products.invalidate(categories=[category])
     except:
         print('Could not add product')
-    conn.commit()
-    conn.close()
-    manage_products()
+    return manage_products
 def delete_product():
     print('Delete product\n')
     id = int(input('Enter product ID to be deleted : '))
     
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM products WHERE id=?', (id,))
-    row = cursor.fetchone()
-    if row:
-        cursor.execute('DELETE FROM products WHERE id=?', (id,))
+    with db.connection() as conn:
+        deleted = conn.execute('DELETE FROM products WHERE id=? RETURNING category', (id,)).fetchall()
+    catalog.products.invalidate([id], [row[0] for row in deleted])
+    if deleted:
         print(f'Product ID {id} deleted successfully.')
     else:
         print('Product not found')
         
-    conn.commit()
-    conn.close()
-    manage_products()
+    return manage_products
 def update_product():
     print('\nUpdate product\n')
     id = int(input('Enter product ID to be updated: '))
 
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM products WHERE id=?', (id,))
-    row = cursor.fetchone()
+    # read from the database, not the product cache: other processes may have sold stock since it was cached
+    with db.connection() as conn:
+        row = conn.execute('SELECT name, category, price, stock, reorder_level FROM products WHERE id=?', (id,)).fetchone()
+        sales = analytics.product_sales(conn.cursor(), id)
     
     if row:
-        current_name, current_category, current_price, current_stock = row[1], row[2], row[3], row[4]
+        current_name, current_category, current_price, current_stock, current_level = row
+        print(f'Sold so far: {sales[1]} units in {sales[0]} orders (₹{sales[2]})')
         
-        name = input(f'Enter new product name ({current_name}): ') or current_name
-        category = input(f'Enter new product category ({current_category}): ') or current_category
+        # only the fields the admin fills in are written, so a blank answer never overwrites a concurrent change
+        updates = {}
+        name = input(f'Enter new product name ({current_name}): ')
+        if name:
+            updates['name'] = name
+        category = input(f'Enter new product category ({current_category}): ')
+        if category:
+            updates['category'] = category
         
         price_input = input(f'Enter new product price ({current_price}): ')
-        price = int(price_input) if price_input else current_price
+        if price_input:
+            updates['price'] = int(price_input)
 
         stock_input = input(f'Enter new product stock ({current_stock}): ')
-        stock = int(stock_input) if stock_input else current_stock
-
-        cursor.execute('UPDATE products SET name=?, category=?, price=?, stock=? WHERE id=?',(name, category, price, stock, id))
-        conn.commit()
+        if stock_input:
+            updates['stock'] = int(stock_input)
+
+        level_input = input(f'Enter new reorder level ({current_level}): ')
+        if level_input:
+            updates['reorder_level'] = int(level_input)
+
+        if updates:
+            with db.transaction(immediate=True) as conn:
+                old = conn.execute('SELECT category FROM products WHERE id=?', (id,)).fetchone()
+                conn.execute(f'UPDATE products SET {", ".join(f"{column}=?" for column in updates)} WHERE id=?',
+                             (*updates.values(), id))
+            catalog.products.invalidate([id], {old[0] if old else current_category, updates.get('category', current_category)})
         print(f'Product ID {id} updated successfully.')
     else:
         print('Product not found.')
 
-    conn.close()
-    manage_products()
+    return manage_products
 
 def view_product():
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM products')
-    rows = cursor.fetchall()
-    
-    if not rows:
-        print("\nNo Products Available")
+    browse_products()
+    return manage_products
+
+def view_low_stock():
+    print_low_stock()
+    return manage_products
+
+def print_low_stock():
+    with db.connection() as conn:
+        rows = analytics.low_stock_alerts(conn.cursor())
+    if rows:
+        headers = ["Product ID", "Name", "Category", "Stock", "Reorder Level", "Short By"]
+        print("\nProducts Below Reorder Level:\n")
+        print(tabulate(rows, headers=headers, tablefmt="fancy_grid"))
     else:
-        headers = ["Product ID", "Name", "Category", "Price (₹)", "Stock"]
-        table = tabulate(rows, headers=headers, tablefmt="fancy_grid")
-        print("\nProduct List:\n")
-        print(table)
-    conn.close()
-    manage_products() 
+        print("\nAll products are at or above their reorder level.")
+
+# catalog browsing, one keyset page at a time
+PAGE_SIZE = 20
+
+def product_page(cursor, after_id=0, category=None, min_price=None, max_price=None, in_stock=False, limit=PAGE_SIZE):
+    conditions, params = ["id > ?"], [after_id]
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+    if min_price is not None:
+        conditions.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("price <= ?")
+        params.append(max_price)
+    if in_stock:
+        conditions.append("stock > 0")
+    cursor.execute(f"SELECT id, name, category, price, stock FROM products WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?", (*params, limit))
+    return cursor.fetchall()
+
+def iter_products(page_size=PAGE_SIZE, **filters):
+    after_id = 0
+    while True:
+        with db.connection() as conn:
+            rows = product_page(conn.cursor(), after_id, limit=page_size, **filters)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1][0]
+
+# every word is matched as a prefix; name matches weigh more than category matches
+def search_query(text):
+    words = re.findall(r"\w+", text)
+    return " ".join('"' + word + '"*' for word in words)
+
+def search_products(cursor, text, page=0, limit=PAGE_SIZE):
+    query = search_query(text)
+    if not query:
+        return []
+    cursor.execute("""
+        SELECT p.id, p.name, p.category, p.price, p.stock
+        FROM products_fts f JOIN products p ON p.id = f.rowid
+        WHERE products_fts MATCH ?
+        ORDER BY bm25(products_fts, 10.0, 1.0), p.id
+        LIMIT ? OFFSET ?
+    """, (query, limit, page * limit))
+    return cursor.fetchall()
+
+@metrics.timed("search")
+def print_search_results(text, interactive=True, page=0):
+    headers = ["Product ID", "Name", "Category", "Price (₹)", "Stock"]
+    shown = 0
+    while True:
+        with db.connection() as conn:
+            rows = search_products(conn.cursor(), text, page)
+        if rows:
+            print(tabulate(rows, headers=headers, tablefmt="fancy_grid"))
+            shown += len(rows)
+        if not interactive or len(rows) < PAGE_SIZE or input("Enter for next page, q to stop: ").strip().lower() == 'q':
+            break
+        page += 1
+    if not shown:
+        print(f"\nNo products match '{text}'.")
+
+def ask_product_filters():
+    category = input("Filter by category (blank for all): ").strip() or None
+    min_price = input("Minimum price (blank for none): ").strip()
+    max_price = input("Maximum price (blank for none): ").strip()
+    in_stock = input("In stock only? (y/n): ").strip().lower() == 'y'
+    return dict(category=category, min_price=float(min_price) if min_price else None,
+                max_price=float(max_price) if max_price else None, in_stock=in_stock)
+
+def browse_products(filters=None, interactive=True):
+    headers = ["Product ID", "Name", "Category", "Price (₹)", "Stock"]
+    shown = 0
+    for rows in iter_products(**(filters if filters is not None else ask_product_filters())):
+        if not shown:
+            print("\nProduct List:\n")
+        print(tabulate(rows, headers=headers, tablefmt="fancy_grid"))
+        shown += len(rows)
+        if interactive and len(rows) == PAGE_SIZE and input("Enter for next page, q to stop: ").strip().lower() == 'q':
+            break
+    if not shown:
+        print("\nNo Products Available")
 
 def view_orders():
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM orders')
-    rows = cursor.fetchall()
+    browse_orders()
+    return admin_dashboard
+
+# order history, one keyset page at a time
+@metrics.timed("orders")
+def order_page(cursor, after_id=0, user_id=None, since=None, until=None, min_total=None, max_total=None,
+               discount=None, limit=PAGE_SIZE):
+    where, params = analytics.time_filter("time", since, until)
+    conditions, params = ["id > ?", where], [after_id, *params]
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if min_total is not None:
+        conditions.append("total_price >= ?")
+        params.append(min_total)
+    if max_total is not None:
+        conditions.append("total_price <= ?")
+        params.append(max_total)
+    if discount is not None:
+        conditions.append("discount_per = ?")
+        params.append(discount)
+    cursor.execute(f"""
+        SELECT id, user_id, products, total_price, discount_per, datetime(time, 'unixepoch', 'localtime')
+        FROM orders WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?
+    """, (*params, limit))
+    return cursor.fetchall()
 
-    if not rows:
+def iter_orders(page_size=PAGE_SIZE, **filters):
+    after_id = 0
+    while True:
+        with db.connection() as conn:
+            rows = order_page(conn.cursor(), after_id, limit=page_size, **filters)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1][0]
+
+def ask_order_filters():
+    user_id = input("Filter by user ID (blank for all): ").strip()
+    since, until = ask_date_range()
+    min_total = input("Minimum total (blank for none): ").strip()
+    max_total = input("Maximum total (blank for none): ").strip()
+    discount = input("Discount tier % (blank for all): ").strip()
+    return dict(user_id=int(user_id) if user_id else None, since=since, until=until,
+                min_total=float(min_total) if min_total else None, max_total=float(max_total) if max_total else None,
+                discount=float(discount) if discount else None)
+
+def browse_orders(filters=None, interactive=True):
+    headers = ["Order ID", "User ID", "Products", "Total Price (₹)", "Discount (%)", "Time"]
+    shown = 0
+    for rows in iter_orders(**(filters if filters is not None else ask_order_filters())):
+        if not shown:
+            print("\nOrder List:\n")
+        print(tabulate(rows, headers=headers, tablefmt="fancy_grid"))
+        shown += len(rows)
+        if interactive and len(rows) == PAGE_SIZE and input("Enter for next page, q to stop: ").strip().lower() == 'q':
+            break
+    if not shown:
         print("\nNo orders found.")
-    else:
-        headers = ["Order ID", "User ID", "Products", "Total Price (₹)", "Discount (%)", "Time"]
-        table = tabulate(rows, headers=headers, tablefmt="fancy_grid") 
-        print("\nOrder List:\n")
-        print(table)
-    conn.close()
-    admin_dashboard()
 
 def view_analysis():
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-
     while True:
         print("\nInventory Analysis Menu")
         print("1. Revenue Analysis (Weekly & Monthly)")
         print("2. Top 5 Most Bought Products")
         print("3. Low Stock Products")
         print("4. Most Active Order Hours")
-        print("5. Exit")
+        print("5. Rebuild Revenue Summaries")
+        print("6. Exit")
 
         choice = input("Enter your choice: ")
 
-        if choice == '1':
-            show_revenue_analysis(cursor)
-        elif choice == '2':
-            show_top_products(cursor)
-        elif choice == '3':
-            show_low_stock(cursor)
-        elif choice == '4':
-            show_peak_hours(cursor)
+        reports = {'1': "revenue", '2': "top-products", '3': "low-stock", '4': "peak-hours"}
+        if choice in reports:
+            since, until = ask_date_range() if choice != '3' else (None, None)
+            with db.connection() as conn:
+                show_report(conn.cursor(), reports[choice], since, until)
         elif choice == '5':
-            conn.close()
-            admin_dashboard()
-            return
+            with db.transaction() as conn:
+                rebuild_revenue_rollups(conn)
+                rebuild_sales_rollups(conn)
+                rebuild_period_units(conn)
+            print("Revenue summaries rebuilt from order history.")
+        elif choice == '6':
+            return admin_dashboard
         else:
             print("Invalid choice. Please enter a valid option.")
-            admin_dashboard()
-
-def show_revenue_analysis(cursor):
-    cursor.execute("SELECT total_price, time FROM orders")
-    orders = cursor.fetchall()
-
-    weekly_revenue = {}
-    monthly_revenue = {}
 
-    for total_price, time in orders:
-        order_date = datetime.datetime.strptime(time, "%Y-%m-%d %H:%M:%S")
-        week = order_date.strftime("%Y-W%W")
-        month = order_date.strftime("%Y-%m")
-
-        weekly_revenue[week] = weekly_revenue.get(week, 0) + total_price
-        monthly_revenue[month] = monthly_revenue.get(month, 0) + total_price
-
-    weeks = sorted(weekly_revenue.keys())
-    months = sorted(monthly_revenue.keys())
+def view_performance():
+    print_performance()
+    return admin_dashboard
+
+# latency percentiles for this session; slow statements also go to metrics.SLOW_QUERY_LOG
+def print_performance(limit=10):
+    stats = metrics.snapshot(limit)
+    columns = ["count", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    cache = catalog.products.stats()
+    print(f"\nProduct cache: {cache['hits']} hits, {cache['misses']} misses (hit rate {cache['hit_rate']:.1%}), "
+          f"{cache['size']}/{cache['capacity']} entries")
+    if not stats["operations"] and not stats["statements"]:
+        print("\nNo timings recorded yet.")
+        return
+    print("\nOperations:\n")
+    print(tabulate([[name] + [s[c] for c in columns] for name, s in stats["operations"].items()],
+                   headers=["Operation", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms"]))
+    print(f"\nTop {limit} statements by total time:\n")
+    print(tabulate([[sql[:80], s["count"], s["rows"], s["total_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"]]
+                    for sql, s in stats["statements"].items()],
+                   headers=["Statement", "Count", "Rows", "Total ms", "p50 ms", "p95 ms", "p99 ms"]))
+
+# chart name -> (drawing function, takes a date range)
+REPORTS = {}
+
+def orders_fingerprint(cursor):
+    return cursor.execute("SELECT MAX(id), COUNT(*) FROM orders").fetchone()
+
+def show_report(cursor, name, since=None, until=None):
+    with metrics.operation(f"report.{name}"):
+        return draw_report(cursor, name, since, until)
+
+def draw_report(cursor, name, since=None, until=None):
+    show, ranged = REPORTS[name]
+    args = (since, until) if ranged else ()
+    plt = pyplot()
+    if not HEADLESS:
+        show(cursor, *args)
+        plt.show()
+        return None
+
+    # the file name carries a fingerprint of the data, so an unchanged chart is served as is
+    data = analytics.low_stock(cursor, 5) if name == "low-stock" else orders_fingerprint(cursor)
+    args_key = hashlib.sha1(repr(args).encode()).hexdigest()[:8]
+    data_key = hashlib.sha1(repr(data).encode()).hexdigest()[:12]
+    path = os.path.join(REPORT_DIR, f"{name}-{args_key}-{data_key}.{REPORT_FORMAT}")
+    if not os.path.exists(path):
+        show(cursor, *args)
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        for stale in glob.glob(os.path.join(REPORT_DIR, f"{name}-{args_key}-*.{REPORT_FORMAT}")):
+            os.remove(stale)
+        partial = f"{path}.tmp"
+        plt.savefig(partial, format=REPORT_FORMAT, bbox_inches="tight")
+        plt.close()
+        os.replace(partial, path)
+    print(f"Chart saved to {path}")
+    return path
+
+def ask_date_range():
+    since = ask_date("From date YYYY-MM-DD (blank for all): ")
+    until = ask_date("Up to (not including) date YYYY-MM-DD (blank for all): ")
+    return since, until
+
+def ask_date(prompt):
+    while True:
+        text = input(prompt).strip()
+        if not text:
+            return None
+        try:
+            return analytics.to_epoch(text)
+        except ValueError:
+            print("Invalid date. Use YYYY-MM-DD.")
+
+def show_revenue_analysis(cursor, since=None, until=None):
+    plt = pyplot()
+    weekly_revenue = dict(analytics.revenue_by_period(cursor, "week", since, until))
+    monthly_revenue = dict(analytics.revenue_by_period(cursor, "month", since, until))
+
+    weeks = list(weekly_revenue)
+    months = list(monthly_revenue)
 
     plt.figure(figsize=(8, 5))
     plt.bar(weeks, [weekly_revenue[w] for w in weeks], color='b', alpha=0.6, label="Weekly Revenue")
@@ -332,33 +908,22 @@ def show_revenue_analysis(cursor):
     plt.ylabel("Revenue (₹)")
     plt.legend()
     plt.grid(True, linestyle="--", alpha=0.6)
-    plt.show()
-
-def show_top_products(cursor):
-    cursor.execute("SELECT products FROM orders")
-    product_orders = cursor.fetchall()
-
-    product_count = {}
-    for order in product_orders:
-        products = order[0].split(", ")
-        for product in products:
-            name = product.split(" (x")[0]
-            product_count[name] = product_count.get(name, 0) + 1
 
-    top_products = sorted(product_count.items(), key=lambda x: x[1], reverse=True)[:5]
-    product_names, order_counts = zip(*top_products) if top_products else ([], [])
+def show_top_products(cursor, since=None, until=None):
+    plt = pyplot()
+    top = analytics.top_products(cursor, 5, since, until)
+    product_names, unit_counts = zip(*top) if top else ([], [])
 
     plt.figure(figsize=(7, 5))
-    plt.bar(product_names, order_counts, color="orange")
+    plt.bar(product_names, unit_counts, color="orange")
     plt.title("Top 5 Most Bought Products")
     plt.xticks(rotation=30)
-    plt.ylabel("Orders Count")
+    plt.ylabel("Units Sold")
     plt.grid(axis="y", linestyle="--", alpha=0.6)
-    plt.show()
 
 def show_low_stock(cursor):
-    cursor.execute("SELECT name, stock FROM products ORDER BY stock ASC LIMIT 5")
-    low_stock = cursor.fetchall()
+    plt = pyplot()
+    low_stock = analytics.low_stock(cursor, 5)
 
     product_names, stock_counts = zip(*low_stock) if low_stock else ([], [])
 
@@ -368,24 +933,24 @@ def show_low_stock(cursor):
     plt.xticks(rotation=30)
     plt.ylabel("Stock Remaining")
     plt.grid(axis="y", linestyle="--", alpha=0.6)
-    plt.show()
 
-def show_peak_hours(cursor):
-    cursor.execute("SELECT time FROM orders")
-    order_times = cursor.fetchall()
-
-    hours = [datetime.datetime.strptime(t[0], "%Y-%m-%d %H:%M:%S").hour for t in order_times]
-    hour_ranges = ["0-4 AM", "5-8 AM", "9-12 PM", "1-4 PM", "5-8 PM", "9-12 AM"]
-    hour_bins = [0, 5, 9, 13, 17, 21, 24]
-    hist, _ = np.histogram(hours, bins=hour_bins)
+def show_peak_hours(cursor, since=None, until=None):
+    plt = pyplot()
+    hist = analytics.peak_hours(cursor, since, until)
 
     plt.figure(figsize=(7, 5))
-    plt.bar(hour_ranges, hist, color="purple", alpha=0.7, edgecolor="black")
+    plt.bar(analytics.HOUR_RANGES, hist, color="purple", alpha=0.7, edgecolor="black")
     plt.title("Most Active Order Hours (Grouped)")
     plt.xlabel("Time of Day")
     plt.ylabel("Order Count")
     plt.grid(axis="y", linestyle="--", alpha=0.6)
-    plt.show()
+
+REPORTS.update({
+    "revenue": (show_revenue_analysis, True),
+    "top-products": (show_top_products, True),
+    "low-stock": (show_low_stock, False),
+    "peak-hours": (show_peak_hours, True),
+})
 
 # user dashboard
 def user_dashboard(userid):
@@ -396,129 +961,159 @@ def user_dashboard(userid):
     print('4. Remove From Cart')
     print('5. View Cart')
     print('6. Check Out')
-    print('7. Exit')
+    print('7. Search Products')
+    print('8. Exit')
     choice = input("Enter your choice: ")
     if choice == '1':
-        view_products(userid)
+        return view_products, userid
     elif choice == '2':
-        wishlist(userid)
+        return wishlist, userid
     elif choice == '3':
-        add_to_cart(userid)
+        return add_to_cart, userid
     elif choice == '4':
-       remove_from_cart(userid)
+        return remove_from_cart, userid
     elif choice == '5':
-        view_cart(userid)
+        return view_cart, userid
     elif choice == '6':
-        check_out(userid)
+        return check_out, userid
     elif choice == '7':
-        main_menu()
+        return search, userid
+    elif choice == '8':
+        return main_menu
     else:
         print("Invalid choice. Please enter a valid option.")
-        user_dashboard()
+        return user_dashboard, userid
         
 # user functions
 def view_products(userid):
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM products')
-    rows = cursor.fetchall()
-    
-    if not rows:
-        print("\nNo Products Available")
-    else:
-        headers = ["Product ID", "Name", "Category", "Price (₹)", "Stock"]
-        table = tabulate(rows, headers=headers, tablefmt="fancy_grid")
-        print("\nProduct List:\n")
-        print(table)
-    conn.close()
-    user_dashboard(userid) 
+    browse_products()
+    return user_dashboard, userid
+
+def search(userid):
+    text = input("Search products: ")
+    print_search_results(text)
+    return user_dashboard, userid
 
 def wishlist(userid):
     print('\nWishlist')
     print('1. Add product')
     print('2. Remove product')
     print('3. View wishlist')
-    print('4. Exit')
+    print('4. View alerts')
+    print('5. Exit')
     choice = int(input('Enter your choice : '))
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
     if choice == 1:
         print('\nAdding Product')
         id = int(input('Enter product ID: '))
+        add_wishlist_item(userid, id)
+        return wishlist, userid
+    elif choice == 2:
+        print('\nRemoving Product')
+        id = int(input('Enter product ID: '))
+        remove_wishlist_item(userid, id)
+        return wishlist, userid
+    elif choice == 3:
+        print_wishlist(userid)
+        return wishlist, userid
+    elif choice == 4:
+        print_alerts(userid)
+        return wishlist, userid
+    elif choice == 5: 
+        return user_dashboard, userid
+    else:
+        print("Invalid choice. Please enter a valid option.")
+        return wishlist, userid
 
-        conn = sqlite3.connect("inventory.db")
-        cursor = conn.cursor()
-
+def add_wishlist_item(userid, id):
+    with db.connection() as conn:
         # Check if product exists in products table
-        cursor.execute('SELECT * FROM products WHERE id=?', (id,))
-        row = cursor.fetchone()
+        row = catalog.products.get(conn.cursor(), id)
+        exists = row and conn.execute('SELECT 1 FROM wishlist WHERE user_id=? AND product_id=?', (userid, id)).fetchone()
+        if row and not exists:
+            conn.execute('INSERT INTO wishlist (user_id, product_id) VALUES (?, ?)', (userid, id))
 
-        if not row:
-            print('Product not found.')
-            conn.close()
-            return wishlist(userid)
-
-        cursor.execute('SELECT 1 FROM wishlist WHERE user_id=? AND product_id=?', (userid, id))
-        exists = cursor.fetchone()
+    if not row:
+        print('Product not found.')
+    elif exists:
+        print("Product is already in your wishlist.")
+    else:
+        print("Product added to wishlist.")
+    return bool(row and not exists)
 
-        if exists:
-            print("Product is already in your wishlist.")
-        else:
-            cursor.execute('INSERT INTO wishlist (user_id, product_id) VALUES (?, ?)', (userid, id))
-            conn.commit()
-            print("Product added to wishlist.")
+def remove_wishlist_item(userid, id):
+    with db.connection() as conn:
+        conn.execute('DELETE FROM wishlist WHERE user_id=? AND product_id=?', (userid, id))
+    print("Product removed from wishlist.")
 
-        conn.close()
-        wishlist(userid)
-    elif choice == 2:
-        print('\nRemoving Product')
-        id = int(input('Enter product ID: '))
-        cursor.execute('DELETE FROM wishlist WHERE user_id=? AND product_id=?', (userid, id))
-        conn.commit()
-        print("Product removed from wishlist.")
-        wishlist(userid)
-    elif choice == 3:
-        cursor.execute('''
+def print_wishlist(userid):
+    with db.connection() as conn:
+        rows = conn.execute('''
             SELECT p.id, p.name, p.category, p.price 
             FROM wishlist w
             JOIN products p ON w.product_id = p.id
             WHERE w.user_id = ?
-        ''', (userid,))
-        rows = cursor.fetchall()
+        ''', (userid,)).fetchall()
 
-        if rows:
-            print("\nYour Wishlist:")
-            for row in rows:
-                print(f'Product ID: {row[0]}, Name: {row[1]}, Category: {row[2]}, Price: ₹{row[3]}')
-        else:
-            print("Your wishlist is empty.")
-        wishlist(userid)
-    elif choice == 4: 
-        user_dashboard(userid)
+    if rows:
+        print("\nYour Wishlist:")
+        for row in rows:
+            print(f'Product ID: {row[0]}, Name: {row[1]}, Category: {row[2]}, Price: ₹{row[3]}')
     else:
-        print("Invalid choice. Please enter a valid option.")
-        wishlist(userid)
-
-    conn.close()
+        print("Your wishlist is empty.")
     
+# price drops and restocks of wishlisted products since the alerts were last viewed
+def print_alerts(userid):
+    changes.run_notifier()
+    # reads then writes: take the write lock up front, as changes.consume does
+    with db.transaction(immediate=True) as conn:
+        alerts = changes.unseen_alerts(conn.cursor(), userid)
+        if alerts:
+            changes.mark_seen(conn.cursor(), userid, alerts[0][0])
+
+    if not alerts:
+        print("No new alerts for your wishlist.")
+    for _, prod_id, name, kind, old, new, _ in alerts:
+        if kind == "price_drop":
+            print(f"Price drop: {name} (Product ID: {prod_id}) is now ₹{new}, was ₹{old}")
+        else:
+            print(f"Back in stock: {name} (Product ID: {prod_id}), {int(new)} available")
+
 def add_to_cart(userid):
     print('\nAdding Product to Cart')
     id = int(input("Enter product ID: "))
     quantity = int(input("Enter quantity: "))
 
-    conn = sqlite3.connect("inventory.db")
+    with db.connection() as conn:
+        add_cart_item(conn, userid, id, quantity)
+    return user_dashboard, userid  # Return to dashboard
+
+# stock not held by other shoppers' unexpired reservations
+AVAILABLE_STOCK = """
+    stock - (SELECT COALESCE(SUM(r.quantity), 0) FROM reservations r
+             WHERE r.product_id = products.id AND r.user_id != ? AND r.expires_at > ?)
+"""
+
+@metrics.timed("add_to_cart")
+def add_cart_item(conn, userid, id, quantity):
     cursor = conn.cursor()
+    now = time.time()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        added = reserve_cart_item(cursor, userid, id, quantity, now)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return added
 
+def reserve_cart_item(cursor, userid, id, quantity, now):
     # Check if product exists in inventory
-    cursor.execute("SELECT stock FROM products WHERE id=?", (id,))
+    cursor.execute(f"SELECT {AVAILABLE_STOCK} FROM products WHERE id=?", (userid, now, id))
     row = cursor.fetchone()
 
     if not row:
         print("Product not found.")
-        conn.close()
-        user_dashboard(userid)
-        return
+        return False
 
     stock = row[0]  # Available stock
 
@@ -541,93 +1136,137 @@ def add_to_cart(userid):
             cursor.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)", 
                            (userid, id, quantity))
             print(f"Added {quantity} units of Product ID {id} to cart.")
+        new_quantity = quantity
 
-    conn.commit()
-    conn.close()
-    user_dashboard(userid)  # Return to dashboard
+    if new_quantity > stock:
+        return False
+    if RESERVATION_TTL:
+        cursor.execute("DELETE FROM reservations WHERE expires_at <= ?", (now,))
+        cursor.execute("""
+            INSERT INTO reservations (user_id, product_id, quantity, expires_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, product_id) DO UPDATE SET quantity = excluded.quantity, expires_at = excluded.expires_at
+        """, (userid, id, new_quantity, now + RESERVATION_TTL))
+    return True
     
+@metrics.timed("recommend")
 def recommend_product(user_id):
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-
-    # Fetch product categories from the user's cart
-    cursor.execute("""
-        SELECT DISTINCT p.category 
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?
-    """, (user_id,))
-    
-    cart_categories = [row[0] for row in cursor.fetchall()]
-
-    if not cart_categories:
-        print("\nNo recommendations available as your cart is empty.")
-        conn.close()
-        return
-
-    # Fetch products from the same categories but not in the cart
-    placeholders = ', '.join(['?'] * len(cart_categories))
-    cursor.execute(f"""
-        SELECT id, name, category FROM products 
-        WHERE category IN ({placeholders}) AND id NOT IN (
-            SELECT product_id FROM cart WHERE user_id = ?
-        )
-    """, (*cart_categories, user_id))
-
-    recommended = cursor.fetchall()
-    conn.close()
+    with db.connection() as conn:
+        recommended = find_recommendations(conn.cursor(), user_id)
 
     # Display recommendations
-    if recommended:
-        print("\nRecommended Products Based on Your Cart Categories:")
+    if recommended is None:
+        print("\nNo recommendations available as your cart is empty.")
+    elif recommended:
+        print("\nRecommended Products for You:")
         for prod_id, name, category in recommended[:5]:  # Show top 5 recommendations
             print(f"{name} (Product ID: {prod_id}, Category: {category})")
     else:
-        print("\nNo additional recommendations available in these categories.")
+        print("\nNo additional recommendations available for your cart.")
+
+def find_recommendations(cursor, user_id, limit=5):
+    cursor.execute("SELECT product_id FROM cart WHERE user_id = ?", (user_id,))
+    cart_ids = [row[0] for row in cursor.fetchall()]
+
+    if not cart_ids:
+        return None
+
+    # Products most often bought together with the cart's products
+    ids = recommendations.for_products(cursor, cart_ids, limit)
+    if not ids:
+        # No purchase history yet: other products from the cart's categories
+        categories = {row[2] for row in catalog.products.get_many(cursor, cart_ids).values()}
+        ids = []
+        for category in sorted(categories):
+            ids += [id for id in catalog.products.category_ids(cursor, category) if id not in cart_ids][:limit]
+        ids = ids[:limit]
+
+    products = catalog.products.get_many(cursor, ids)
+    return [products[id][:3] for id in ids if id in products]
 
 def remove_from_cart(userid):
     print('\nRemoving Product from Cart')
     id = int(input('Enter product ID to remove: '))
+    remove_cart_item(userid, id)
+    return view_cart, userid
 
-    conn = sqlite3.connect("inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM cart WHERE user_id=? AND product_id=?', (userid, id))
-    row = cursor.fetchone()
+def remove_cart_item(userid, id):
+    with db.transaction() as conn:
+        removed = delete_cart_item(conn.cursor(), userid, id)
 
-    if row:
-        cursor.execute('DELETE FROM cart WHERE user_id=? AND product_id=?', (userid, id))
-        conn.commit()
+    if removed:
         print(f'Product ID {id} removed from cart successfully.')
     else:
         print('Product not found in cart.')
+    return bool(removed)
+
+def delete_cart_item(cursor, userid, id):
+    removed = cursor.execute('DELETE FROM cart WHERE user_id=? AND product_id=?', (userid, id)).rowcount
+    cursor.execute('DELETE FROM reservations WHERE user_id=? AND product_id=?', (userid, id))
+    return removed
 
-    conn.close()
-    view_cart(userid) 
 def view_cart(userid):
-    print("\nYour Cart")
-    conn=sqlite3.connect('inventory.db')
-    cursor=conn.cursor()
-    cursor.execute("""
-        SELECT p.id, p.name, p.category, p.price, c.quantity
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?
-    """, (userid,))
+    print_cart(userid)
+    return user_dashboard, userid
 
-    rows = cursor.fetchall()
+@metrics.timed("view_cart")
+def print_cart(userid):
+    print("\nYour Cart")
+    with db.connection() as conn:
+        lines = conn.execute("SELECT product_id, quantity FROM cart WHERE user_id = ?", (userid,)).fetchall()
+        products = catalog.products.get_many(conn.cursor(), [line[0] for line in lines])
+    rows = [products[id][:4] + (quantity,) for id, quantity in lines if id in products]
 
     if rows:
         for row in rows:
             print(f"Product ID: {row[0]}, Name: {row[1]}, Price: ₹{row[3]}, Quantity: {row[4]}")
+        # a preview at today's prices; checkout re-prices the cart when it takes the stock
+        quote = price_list().quote([(row[3], row[4]) for row in rows])
+        print(f"Subtotal: ₹{quote.subtotal}, Discount ({quote.percent}%): -₹{quote.discount}, Total: ₹{quote.total}")
         recommend_product(userid)
     else:
         print("Your cart is empty.")
-    conn.close()
-    user_dashboard(userid)
+
+# the shop's compiled discount ladder
+def price_list():
+    import pricing
+    return pricing.default()
+
+def print_quote(cart_items, quote):
+    for item, amount in zip(cart_items, quote.lines):
+        print(f"Product: {item[1]}, Quantity: {item[4]}, Price: ₹{amount}")
+    print(f"Total: ₹{quote.subtotal}")
+    print(f"Discount ({quote.percent}%): -₹{quote.discount}")
+    print(f"Final Amount: ₹{quote.total}")
+
 def check_out(userid):
-    conn = sqlite3.connect("inventory.db")
+    with db.connection() as conn:
+        place_order(conn, userid)
+    return user_dashboard, userid
+
+@metrics.timed("checkout")
+def place_order(conn, userid):
     cursor = conn.cursor()
 
+    try:
+        # take the write lock up front so cart, stock and order stay consistent
+        cursor.execute("BEGIN IMMEDIATE")
+        order = checkout_cart(cursor, userid)
+    except Exception as e:
+        conn.rollback() 
+        print("Error during checkout:", e)
+        return None
+
+    if not order:
+        conn.rollback()
+        return None
+    order_id, product_ids, co_purchases = order
+    conn.commit() 
+    catalog.products.invalidate(product_ids)
+    recommendations.remember(co_purchases)
+    print("Checkout successful! Your order has been placed.")
+    return order_id
+
+def checkout_cart(cursor, userid):
     cursor.execute("""
         SELECT p.id, p.name, p.category, p.price, c.quantity
         FROM cart c
@@ -639,100 +1278,215 @@ def check_out(userid):
 
     if not cart_items:
         print("\nYour cart is empty. Add items before checking out.")
-        conn.close()
-        return
-    total_price = sum(row[3] * row[4] for row in cart_items)
-    # Inside your checkout function
-    discount_per = 15
-    discount_amount = (discount_per / 100) * total_price
-    # Apply conditional discount
-    if total_price < 500:
-        discount_per = 0 
-    elif 500 <= total_price < 1000:
-        discount_per = 5 
-    elif 1000 <= total_price < 2000:
-        discount_per = 10 
-    else:
-        discount_per = 15
-    discount_amount = (discount_per / 100) * total_price
-    final_price = total_price - discount_amount
+        return None
+
+    # decrement only while enough unreserved stock is left, collecting the lines that fall short
+    now = time.time()
+    short = []
+    for item in cart_items:
+        cursor.execute(f"""
+            UPDATE products SET stock = stock - ? WHERE id = ? AND {AVAILABLE_STOCK} >= ?
+        """, (item[4], item[0], userid, now, item[4]))
+        if cursor.rowcount == 0:
+            short.append(item)
+
+    if short:
+        print("\nCheckout failed. Not enough stock for:")
+        for item in short:
+            cursor.execute(f"SELECT {AVAILABLE_STOCK} FROM products WHERE id=?", (userid, now, item[0]))
+            print(f"Product: {item[1]}, Requested: {item[4]}, Available: {max(cursor.fetchone()[0], 0)}")
+        return None
+
+    quote = price_list().quote([(item[3], item[4]) for item in cart_items])
     products_str = ', '.join([f"{row[1]} (x{row[4]})" for row in cart_items])
-    order_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    order_time = int(time.time())
 
     # Display the bill
     print("\n===== BILL =====")
-    for item in cart_items:
-        print(f"Product: {item[1]}, Quantity: {item[4]}, Price: ₹{item[3] * item[4]}")
-    print(f"Total: ₹{total_price}")
-    print(f"Discount ({discount_per}%): -₹{discount_amount}")
-    print(f"Final Amount: ₹{final_price}")
+    print_quote(cart_items, quote)
     print("================\n")
 
-    # Start transaction
-    try:
-        cursor.execute("""
-            INSERT INTO orders (user_id, products, total_price, discount_per, time)
-            VALUES (?, ?, ?, ?, ?)
-        """, (userid, products_str, final_price, discount_per, order_time))
+    cursor.execute("""
+        INSERT INTO orders (user_id, products, total_price, discount_per, time)
+        VALUES (?, ?, ?, ?, ?)
+    """, (userid, products_str, float(quote.total), quote.percent, order_time))
+    order_id = cursor.lastrowid
+
+    cursor.executemany("""
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)
+    """, [(order_id, item[0], item[4], item[3]) for item in cart_items])
+    record_revenue(cursor, order_time, float(quote.total))
+    record_sales(cursor, order_time, [(item[0], item[4]) for item in cart_items])
+    record_period_units(cursor, order_time, [(item[0], item[4]) for item in cart_items])
+    product_ids = [item[0] for item in cart_items]
+    co_purchases = recommendations.record_order(cursor, product_ids)
 
-        for item in cart_items:
-            cursor.execute("""
-                UPDATE products SET stock = stock - ? WHERE id = ?
-            """, (item[4], item[0])) 
+    cursor.execute("""
+        DELETE FROM cart WHERE user_id = ?
+    """, (userid,))
+    cursor.execute("DELETE FROM reservations WHERE user_id = ?", (userid,))
+    return order_id, product_ids, co_purchases
 
-        cursor.execute("""
-            DELETE FROM cart WHERE user_id = ?
-        """, (userid,))
+# command mode: drive single operations from scripts without input()
+def cmd_products(args):
+    browse_products(dict(category=args.category, min_price=args.min_price, max_price=args.max_price,
+                         in_stock=args.in_stock), interactive=False)
 
-        conn.commit() 
-        print("Checkout successful! Your order has been placed.")
+def cmd_search(args):
+    print_search_results(" ".join(args.text), interactive=False, page=args.page)
 
-    except Exception as e:
-        conn.rollback() 
-        print("Error during checkout:", e)
+def cmd_cart(args):
+    print_cart(args.user)
 
-    conn.close()
-    user_dashboard(userid)
-# def recommend_products(user_id):
-#     conn = sqlite3.connect("inventory.db")
-#     cursor = conn.cursor()
-
-#     cursor.execute("SELECT product_id FROM cart WHERE user_id=?", (user_id,))
-#     cart_products = [row[0] for row in cursor.fetchall()]
-
-#     cursor.execute("SELECT products FROM orders WHERE user_id=?", (user_id,))
-#     past_products = []
-#     for order in cursor.fetchall():
-#         past_products += order[0].split(", ")
-
-#     cursor.execute("SELECT products FROM orders")
-#     all_orders = [row[0] for row in cursor.fetchall()]
-
-#     recommended = set()
-#     for order in all_orders:
-#         products = order.split(", ")
-#         for product in products:
-#             if product in cart_products or product in past_products:
-#                 recommended.update(products) 
-
-#     recommended.difference_update(cart_products) 
-#     recommended.difference_update(past_products)
-
-#     if recommended:
-#         placeholders = ', '.join(['?'] * len(recommended))
-#         cursor.execute(f"SELECT id, name FROM products WHERE name IN ({placeholders})", tuple(recommended))
-#         results = cursor.fetchall()
-#     else:
-#         results = []
-
-#     conn.close()
-
-#     if results:
-#         print("\nRecommended Products for You:")
-#         for prod_id, name in results[:5]:
-#             print(f"{name} (Product ID: {prod_id})")
-#     else:
-#         print("\nNo recommendations available.")
-        
-create_tables()
-main_menu()
\ No newline at end of file
+def cmd_add_to_cart(args):
+    with db.connection() as conn:
+        return 0 if add_cart_item(conn, args.user, args.product, args.quantity) else 1
+
+def cmd_remove_from_cart(args):
+    return 0 if remove_cart_item(args.user, args.product) else 1
+
+def cmd_checkout(args):
+    with db.connection() as conn:
+        return 0 if place_order(conn, args.user) else 1
+
+def cmd_wishlist(args):
+    print_wishlist(args.user)
+
+def cmd_wishlist_add(args):
+    return 0 if add_wishlist_item(args.user, args.product) else 1
+
+def cmd_wishlist_remove(args):
+    remove_wishlist_item(args.user, args.product)
+
+def cmd_orders(args):
+    browse_orders(dict(user_id=args.user, since=args.since, until=args.until, min_total=args.min_total,
+                       max_total=args.max_total, discount=args.discount), interactive=False)
+
+def cmd_rebuild_revenue(args):
+    with db.transaction() as conn:
+        rebuild_revenue_rollups(conn)
+        rebuild_sales_rollups(conn)
+        rebuild_period_units(conn)
+    print("Revenue summaries rebuilt from order history.")
+
+def cmd_report(args):
+    with db.connection() as conn:
+        show_report(conn.cursor(), args.name, args.since, args.until)
+
+def cmd_what_if(args):
+    import pricing
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        result = {"current": pricing.replay(cursor, price_list(), args.since, args.until)}
+        if args.tiers:
+            result["what_if"] = pricing.replay(cursor, pricing.PriceList(pricing.parse_tiers(args.tiers)), args.since, args.until)
+    print(json.dumps(result, indent=2))
+
+def cmd_alerts(args):
+    print_alerts(args.user)
+
+def cmd_notify(args):
+    print(f"Processed {changes.run_notifier()} product changes.")
+
+def cmd_changes(args):
+    # one JSON object per change, for consumers that keep their own cursor
+    with db.connection() as conn:
+        for row in changes.read(conn.cursor(), args.after, args.limit):
+            print(json.dumps(dict(zip(changes.CHANGE_COLUMNS.split(", "), row))))
+
+def cmd_low_stock(args):
+    print_low_stock()
+
+def cmd_cache_stats(args):
+    print(catalog.products.stats())
+
+def cmd_stats(args):
+    if args.json:
+        print(json.dumps(dict(metrics.snapshot(), product_cache=catalog.products.stats()), indent=2))
+    else:
+        print_performance()
+
+def cmd_run(args):
+    # one command per line; blank lines and # comments are skipped, stops at the first failure
+    parser = build_parser()
+    with open(args.file, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            status = run_command(parser.parse_args(words))
+            if status:
+                print(f"{args.file}:{number}: command failed: {line.strip()}")
+                return status
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Inventory Management System. Starts the interactive menu when no command is given.")
+    commands = parser.add_subparsers(dest="command")
+
+    def command(name, handler, help, user=False, product=False):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(handler=handler)
+        if user:
+            sub.add_argument("--user", type=int, required=True)
+        if product:
+            sub.add_argument("--product", type=int, required=True)
+        return sub
+
+    products = command("products", cmd_products, "list the product catalog")
+    products.add_argument("--category")
+    products.add_argument("--min-price", type=float)
+    products.add_argument("--max-price", type=float)
+    products.add_argument("--in-stock", action="store_true")
+    search = command("search", cmd_search, "search products by name and category")
+    search.add_argument("text", nargs="+")
+    search.add_argument("--page", type=int, default=0)
+    command("cart", cmd_cart, "show a user's cart", user=True)
+    command("add-to-cart", cmd_add_to_cart, "add a product to a user's cart", user=True, product=True) \
+        .add_argument("--quantity", type=int, default=1)
+    command("remove-from-cart", cmd_remove_from_cart, "remove a product from a user's cart", user=True, product=True)
+    command("checkout", cmd_checkout, "check out a user's cart", user=True)
+    command("wishlist", cmd_wishlist, "show a user's wishlist", user=True)
+    command("wishlist-add", cmd_wishlist_add, "add a product to a user's wishlist", user=True, product=True)
+    command("wishlist-remove", cmd_wishlist_remove, "remove a product from a user's wishlist", user=True, product=True)
+    orders = command("orders", cmd_orders, "list orders by order ID")
+    orders.add_argument("--user", type=int)
+    orders.add_argument("--since", type=analytics.to_epoch, help="first date to include, YYYY-MM-DD")
+    orders.add_argument("--until", type=analytics.to_epoch, help="first date to exclude, YYYY-MM-DD")
+    orders.add_argument("--min-total", type=float)
+    orders.add_argument("--max-total", type=float)
+    orders.add_argument("--discount", type=float, help="discount tier percentage")
+    what_if = command("what-if", cmd_what_if, "re-price past orders under the current and another discount ladder")
+    what_if.add_argument("--tiers", help='discount ladder as "minimum:percent" pairs, e.g. "0:0,800:5,1500:12"')
+    what_if.add_argument("--since", type=analytics.to_epoch, help="first date to include, YYYY-MM-DD")
+    what_if.add_argument("--until", type=analytics.to_epoch, help="first date to exclude, YYYY-MM-DD")
+    command("rebuild-revenue", cmd_rebuild_revenue, "recompute the revenue summaries from order history")
+    report = command("report", cmd_report, "draw an analysis chart (saved under the report directory when headless)")
+    report.add_argument("name", choices=["revenue", "top-products", "low-stock", "peak-hours"])
+    report.add_argument("--since", type=analytics.to_epoch, help="first date to include, YYYY-MM-DD")
+    report.add_argument("--until", type=analytics.to_epoch, help="first date to exclude, YYYY-MM-DD")
+    command("alerts", cmd_alerts, "show and clear a user's new wishlist alerts", user=True)
+    command("notify", cmd_notify, "turn new product changes into wishlist alerts")
+    feed = command("changes", cmd_changes, "print product price/stock changes after a sequence number as JSON lines")
+    feed.add_argument("--after", type=int, default=0)
+    feed.add_argument("--limit", type=int, default=changes.BATCH_SIZE)
+    command("low-stock", cmd_low_stock, "list products below their reorder level, furthest below first")
+    command("cache-stats", cmd_cache_stats, "show product cache hit/miss counters")
+    command("stats", cmd_stats, "show latency percentiles for this process (useful at the end of a run file)") \
+        .add_argument("--json", action="store_true")
+    command("run", cmd_run, "run the commands listed in a file").add_argument("file")
+    return parser
+
+def run_command(args):
+    with metrics.operation(f"command.{args.command}"):
+        return args.handler(args) or 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    create_tables()
+    if args.command is None:
+        run_menus()
+        return 0
+    return run_command(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,78 @@
+import threading
+
+import db
+
+# neighbours kept in memory per product
+TOP_K = 20
+
+# product_id -> [(orders together, other product_id)], best first, at most TOP_K long
+_neighbours = {}
+_loaded_from = None
+_lock = threading.Lock()
+
+
+def backfill(conn):
+    conn.execute("""
+        INSERT INTO co_purchases (product_id, other_id, orders)
+        SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id)
+        FROM order_items a JOIN order_items b ON b.order_id = a.order_id AND b.product_id != a.product_id
+        GROUP BY a.product_id, b.product_id
+    """)
+
+
+# count one order's product pairs; run inside the checkout transaction
+def record_order(cursor, product_ids):
+    product_ids = sorted(set(product_ids))
+    pairs = [(a, b) for a in product_ids for b in product_ids if a != b]
+    counts = []
+    for a, b in pairs:
+        cursor.execute("""
+            INSERT INTO co_purchases (product_id, other_id, orders) VALUES (?, ?, 1)
+            ON CONFLICT(product_id, other_id) DO UPDATE SET orders = orders + 1
+            RETURNING orders
+        """, (a, b))
+        counts.append((a, b, cursor.fetchone()[0]))
+    return counts
+
+
+# fold committed pair counts into the in-memory index
+def remember(counts):
+    with _lock:
+        if _loaded_from != db.get_pool().path:
+            return
+        for product_id, other_id, orders in counts:
+            top = [entry for entry in _neighbours.get(product_id, []) if entry[1] != other_id]
+            if len(top) < TOP_K or orders > top[-1][0]:
+                top.append((orders, other_id))
+                top.sort(key=lambda entry: (-entry[0], entry[1]))
+                _neighbours[product_id] = top[:TOP_K]
+
+
+def load(cursor):
+    global _neighbours, _loaded_from
+    cursor.execute("""
+        SELECT product_id, other_id, orders FROM (
+            SELECT product_id, other_id, orders,
+                   ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY orders DESC, other_id) AS rank
+            FROM co_purchases)
+        WHERE rank <= ?
+        ORDER BY product_id, rank
+    """, (TOP_K,))
+    neighbours = {}
+    for product_id, other_id, orders in cursor:
+        neighbours.setdefault(product_id, []).append((orders, other_id))
+    _neighbours, _loaded_from = neighbours, db.get_pool().path
+
+
+# product ids most often bought with the given ones, best first
+def for_products(cursor, product_ids, limit=5):
+    with _lock:
+        if _loaded_from != db.get_pool().path:
+            load(cursor)
+        scores = {}
+        for product_id in product_ids:
+            for orders, other_id in _neighbours.get(product_id, []):
+                scores[other_id] = scores.get(other_id, 0) + orders
+    exclude = set(product_ids)
+    ranked = sorted((other for other in scores if other not in exclude), key=lambda other: (-scores[other], other))
+    return ranked[:limit]
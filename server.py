@@ -0,0 +1,409 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import analytics
+import auth
+import catalog
+import changes
+import db
+import metrics
+import project
+import recommendations
+
+# network front end: one JSON object per line in, one per line out.
+#   -> {"op": "login", "email": "...", "password": "...", "role": "user"}
+#   <- {"ok": true, "result": {"token": "...", "user_id": 1, "role": "user"}}
+#   -> {"op": "add-to-cart", "token": "...", "product": 2, "quantity": 1}
+#   <- {"ok": true, "result": true, "message": "Added 1 units of Product ID 2 to cart."}
+HOST = os.environ.get("SHOP_HOST", "127.0.0.1")
+PORT = int(os.environ.get("SHOP_PORT", "8765"))
+# most writes committed together by the writer
+MAX_BATCH = int(os.environ.get("SHOP_MAX_BATCH", "256"))
+MAX_PAGE = 100
+# seconds between wishlist notifier runs
+NOTIFY_INTERVAL = float(os.environ.get("SHOP_NOTIFY_INTERVAL", "5"))
+
+
+# a write that must not be committed; its printed output becomes the error message
+class Rejected(Exception):
+    pass
+
+
+class Server:
+    def __init__(self):
+        # reads share the pool, one thread per pooled connection
+        self.readers = ThreadPoolExecutor(max_workers=db.get_pool().size, thread_name_prefix="shop-read")
+        # every write goes through this one connection on this one thread
+        self.writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shop-write")
+        self.writer_conn = db.connect(db.get_pool().path)
+        self.writes = None
+        self.batches = 0
+        self.batched_writes = 0
+
+    async def read(self, function, *args):
+        def run():
+            with db.connection() as conn:
+                return function(conn.cursor(), *args)
+        return await asyncio.get_running_loop().run_in_executor(self.readers, run)
+
+    # queue a write; resolves once the batch holding it has committed
+    async def write(self, function, *args):
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((function, args, future))
+        ok, result, message = await future
+        if not ok:
+            raise Rejected(message)
+        return result, message
+
+    # group commit: take whatever writes queued up while the previous batch ran and commit them together
+    async def run_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.writes.get()]
+            while len(batch) < MAX_BATCH and not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+            try:
+                outcomes = await loop.run_in_executor(self.writer_thread, self.commit_batch,
+                                                      [(function, args) for function, args, _ in batch])
+            except Exception as e:
+                outcomes = [(False, None, f"write failed: {e}")] * len(batch)
+            self.batches += 1
+            self.batched_writes += len(batch)
+            for (_, _, future), outcome in zip(batch, outcomes):
+                if not future.done():
+                    future.set_result(outcome)
+
+    # feed product changes to the wishlist notifier through the writer, so alerts never race a batch
+    async def run_notifier(self):
+        while True:
+            await asyncio.sleep(NOTIFY_INTERVAL)
+            with contextlib.suppress(Rejected):
+                await self.write(write_notify)
+
+    def commit_batch(self, batch):
+        conn = self.writer_conn
+        cursor = conn.cursor()
+        outcomes, after_commit = [], []
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for function, args in batch:
+                # each write gets a savepoint, so one rejected write does not undo the others
+                cursor.execute("SAVEPOINT write")
+                out = io.StringIO()
+                try:
+                    with contextlib.redirect_stdout(out):
+                        result, on_commit = function(cursor, *args)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write")
+                    outcomes.append((False, None, str(e) or out.getvalue().strip()))
+                else:
+                    outcomes.append((True, result, out.getvalue().strip()))
+                    if on_commit:
+                        after_commit.append(on_commit)
+                cursor.execute("RELEASE write")
+            with metrics.operation("server.commit"):
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        for on_commit in after_commit:
+            on_commit()
+        return outcomes
+
+    async def handle(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            response = await self.dispatch(line)
+            writer.write(json.dumps(response, default=to_json).encode() + b"\n")
+            await writer.drain()
+        writer.close()
+
+    async def dispatch(self, line):
+        try:
+            request = json.loads(line)
+            op = request.get("op")
+            if op not in OPS:
+                return {"ok": False, "error": f"unknown op {op!r}"}
+            handler, access = OPS[op]
+            user = None
+            if access != "public":
+                user = auth.session(request.get("token"))
+                if not user:
+                    return {"ok": False, "error": "login required"}
+                if access == "admin" and user[1] != "admin":
+                    return {"ok": False, "error": "admin only"}
+            with metrics.operation(f"server.{op}"):
+                result = await handler(self, request, user)
+        except Rejected as e:
+            return {"ok": False, "error": str(e)}
+        except KeyError as e:
+            return {"ok": False, "error": f"missing field {e}"}
+        except Exception as e:
+            return {"ok": False, "error": str(e) or type(e).__name__}
+        if isinstance(result, tuple):
+            result, message = result
+            return {"ok": True, "result": result, "message": message} if message else {"ok": True, "result": result}
+        return {"ok": True, "result": result}
+
+    async def serve(self, host=HOST, port=PORT, ready=None):
+        self.writes = asyncio.Queue()
+        writer_task = asyncio.create_task(self.run_writer())
+        notifier_task = asyncio.create_task(self.run_notifier())
+        server = await asyncio.start_server(self.handle, host, port, limit=1 << 20)
+        if ready:
+            ready(server.sockets[0].getsockname())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            notifier_task.cancel()
+            writer_task.cancel()
+            self.readers.shutdown()
+            self.writer_thread.shutdown()
+            self.writer_conn.close()
+
+
+# numpy values in results (analytics) serialize as plain numbers and lists
+def to_json(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def page_limit(request):
+    return max(1, min(int(request.get("limit", project.PAGE_SIZE)), MAX_PAGE))
+
+
+# writes run on the writer thread inside the batch transaction; they return (result, after-commit callback)
+def write_signup(cursor, name, email, password):
+    user_id = auth.add_user(cursor, name, email, password, "user")
+    if not user_id:
+        raise Rejected("Email already exists.")
+    return user_id, None
+
+
+def write_add_to_cart(cursor, user_id, product_id, quantity):
+    if quantity < 1:
+        raise Rejected("Quantity must be at least 1.")
+    if not project.reserve_cart_item(cursor, user_id, product_id, quantity, time.time()):
+        raise Rejected()
+    return True, None
+
+
+def write_remove_from_cart(cursor, user_id, product_id):
+    if not project.delete_cart_item(cursor, user_id, product_id):
+        raise Rejected("Product not found in cart.")
+    return True, None
+
+
+def write_checkout(cursor, user_id):
+    order = project.checkout_cart(cursor, user_id)
+    if not order:
+        raise Rejected()
+    order_id, product_ids, co_purchases = order
+
+    def on_commit():
+        catalog.products.invalidate(product_ids)
+        recommendations.remember(co_purchases)
+    return order_id, on_commit
+
+
+def write_wishlist_add(cursor, user_id, product_id):
+    if not catalog.products.get(cursor, product_id):
+        raise Rejected("Product not found.")
+    cursor.execute("""
+        INSERT INTO wishlist (user_id, product_id) VALUES (?, ?)
+        ON CONFLICT(user_id, product_id) DO NOTHING
+    """, (user_id, product_id))
+    return cursor.rowcount == 1, None
+
+
+def write_wishlist_remove(cursor, user_id, product_id):
+    cursor.execute("DELETE FROM wishlist WHERE user_id=? AND product_id=?", (user_id, product_id))
+    return cursor.rowcount == 1, None
+
+
+def write_notify(cursor):
+    handled = 0
+    while True:
+        count = changes.consume_batch(cursor, changes.NOTIFIER, changes.notify_wishlists)
+        handled += count
+        if count < changes.BATCH_SIZE:
+            return handled, None
+
+
+def write_alerts_seen(cursor, user_id, last_id):
+    changes.mark_seen(cursor, user_id, last_id)
+    return True, None
+
+
+# reads run on a pooled connection
+def read_cart(cursor, user_id):
+    lines = cursor.execute("SELECT product_id, quantity FROM cart WHERE user_id = ?", (user_id,)).fetchall()
+    products = catalog.products.get_many(cursor, [line[0] for line in lines])
+    items = [products[id][:4] + (quantity,) for id, quantity in lines if id in products]
+    quote = project.price_list().quote([(item[3], item[4]) for item in items])
+    return {"items": items,
+            "quote": {"subtotal": str(quote.subtotal), "discount_per": quote.percent, "discount": str(quote.discount),
+                      "total": str(quote.total)},
+            "recommendations": project.find_recommendations(cursor, user_id) or []}
+
+
+def read_wishlist(cursor, user_id):
+    return cursor.execute("""
+        SELECT p.id, p.name, p.category, p.price FROM wishlist w JOIN products p ON w.product_id = p.id
+        WHERE w.user_id = ?
+    """, (user_id,)).fetchall()
+
+
+# chart name -> its data, as drawn by the show_* functions
+def read_report(cursor, name, since, until):
+    if name == "revenue":
+        return {period: analytics.revenue_by_period(cursor, period, since, until) for period in ("week", "month")}
+    if name == "top-products":
+        return analytics.top_products(cursor, 5, since, until)
+    if name == "low-stock":
+        return analytics.low_stock_alerts(cursor)
+    if name == "peak-hours":
+        return dict(zip(analytics.HOUR_RANGES, analytics.peak_hours(cursor, since, until).tolist()))
+    raise ValueError(f"unknown report {name!r}")
+
+
+async def op_login(server, request, user):
+    email, password, role = request["email"], request["password"], request.get("role", "user")
+    user_id = await asyncio.get_running_loop().run_in_executor(server.readers, auth.login, email, password, role)
+    if not user_id:
+        raise Rejected("Invalid credentials")
+    return {"token": auth.start_session(user_id, role), "user_id": user_id, "role": role}
+
+
+async def op_logout(server, request, user):
+    auth.end_session(request["token"])
+    return True
+
+
+async def op_signup(server, request, user):
+    return await server.write(write_signup, request["name"], request["email"], request["password"])
+
+
+async def op_products(server, request, user):
+    return await server.read(project.product_page, int(request.get("after_id", 0)), request.get("category"),
+                             request.get("min_price"), request.get("max_price"), bool(request.get("in_stock")),
+                             page_limit(request))
+
+
+async def op_search(server, request, user):
+    return await server.read(project.search_products, request["text"], int(request.get("page", 0)), page_limit(request))
+
+
+async def op_cart(server, request, user):
+    return await server.read(read_cart, user[0])
+
+
+async def op_add_to_cart(server, request, user):
+    return await server.write(write_add_to_cart, user[0], int(request["product"]), int(request.get("quantity", 1)))
+
+
+async def op_remove_from_cart(server, request, user):
+    return await server.write(write_remove_from_cart, user[0], int(request["product"]))
+
+
+async def op_checkout(server, request, user):
+    return await server.write(write_checkout, user[0])
+
+
+async def op_wishlist(server, request, user):
+    return await server.read(read_wishlist, user[0])
+
+
+async def op_wishlist_add(server, request, user):
+    return await server.write(write_wishlist_add, user[0], int(request["product"]))
+
+
+async def op_wishlist_remove(server, request, user):
+    return await server.write(write_wishlist_remove, user[0], int(request["product"]))
+
+
+# unseen wishlist alerts, newest first; returning them marks them seen
+async def op_alerts(server, request, user):
+    alerts = await server.read(changes.unseen_alerts, user[0])
+    if alerts:
+        await server.write(write_alerts_seen, user[0], alerts[0][0])
+    return alerts
+
+
+# shoppers see their own orders; admins may filter by any user
+async def op_orders(server, request, user):
+    user_id = request.get("user_id") if user[1] == "admin" else user[0]
+    return await server.read(project.order_page, int(request.get("after_id", 0)), user_id,
+                             request.get("since"), request.get("until"), request.get("min_total"),
+                             request.get("max_total"), request.get("discount"), page_limit(request))
+
+
+async def op_report(server, request, user):
+    return await server.read(read_report, request["name"], request.get("since"), request.get("until"))
+
+
+async def op_low_stock(server, request, user):
+    return await server.read(analytics.low_stock_alerts)
+
+
+async def op_stats(server, request, user):
+    stats = metrics.snapshot(20)
+    stats["group_commit"] = {"batches": server.batches, "writes": server.batched_writes,
+                             "mean_batch": round(server.batched_writes / server.batches, 2) if server.batches else 0}
+    stats["product_cache"] = catalog.products.stats()
+    return stats
+
+
+# op -> (handler, who may call it)
+OPS = {
+    "login": (op_login, "public"),
+    "signup": (op_signup, "public"),
+    "products": (op_products, "public"),
+    "search": (op_search, "public"),
+    "logout": (op_logout, "user"),
+    "cart": (op_cart, "user"),
+    "add-to-cart": (op_add_to_cart, "user"),
+    "remove-from-cart": (op_remove_from_cart, "user"),
+    "checkout": (op_checkout, "user"),
+    "wishlist": (op_wishlist, "user"),
+    "wishlist-add": (op_wishlist_add, "user"),
+    "wishlist-remove": (op_wishlist_remove, "user"),
+    "alerts": (op_alerts, "user"),
+    "orders": (op_orders, "user"),
+    "report": (op_report, "admin"),
+    "low-stock": (op_low_stock, "admin"),
+    "stats": (op_stats, "admin"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the shop to many clients over a line-delimited JSON protocol")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    project.create_tables()
+    server = Server()
+    try:
+        asyncio.run(server.serve(args.host, args.port,
+                                 ready=lambda address: print(f"Serving on {address[0]}:{address[1]}", file=sys.stderr)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())